@@ -0,0 +1,114 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+
+from api import listing
+from main.cache import tag_versions
+from main.models import city_key
+
+
+def response_key(endpoint, request, versions):
+    params = sorted(request.GET.lists())
+    key = "%s|%s|%s|%s" % (endpoint, params, timezone.now().date(), versions)
+    return "api:" + endpoint + ":" + hashlib.md5(key.encode()).hexdigest()
+
+
+def counter_key(endpoint, counter):
+    return "api-cache:%s:%s" % (counter, endpoint)
+
+
+def count(endpoint, counter):
+    """Count a hit or miss in the cache, where counters may be evicted.
+
+    memcached increments atomically and keeps the database off the request
+    path; the counts are a guide, not an audit.
+    """
+    key = counter_key(endpoint, counter)
+    try:
+        cache.incr(key)
+    except ValueError:  # not counted yet, or evicted
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cached(endpoint, tags_func):
+    """Cache a JSON view's response until one of its tags is invalidated.
+
+    `tags_func(request, *args, **kwargs)` returns the tags the response
+    depends on; main.signals invalidates them when the rows behind them
+    change. Streamed exports are never cached.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if listing.wants_stream(request):
+                return view(request, *args, **kwargs)
+
+            versions = tag_versions(tags_func(request, *args, **kwargs))
+            key = response_key(endpoint, request, versions)
+            entry = cache.get(key)
+            if entry is not None:
+                count(endpoint, "hits")
+                content, content_type = entry
+                response = HttpResponse(content, content_type=content_type)
+                response["X-Cache"] = "HIT"
+                return response
+
+            count(endpoint, "misses")
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                entry = (response.content, response["Content-Type"])
+                cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def groups_tags(request):
+    if request.GET.get("city"):
+        return ["groups:city:" + city_key(request.GET.get("city"))]
+    return ["groups"]
+
+
+def events_tags(request):
+    if request.GET.get("city"):
+        return ["events:city:" + city_key(request.GET.get("city"))]
+    return ["events"]
+
+
+def group_tags(request, group_slug):
+    return ["group:" + group_slug]
+
+
+def event_tags(request, event_slug):
+    return ["event:" + event_slug]
+
+
+def batch_tags(request):
+    groups = listing.slug_list(request.GET.get("groups"))
+    events = listing.slug_list(request.GET.get("events"))
+    return ["group:" + slug for slug in groups] + ["event:" + slug for slug in events]
+
+
+ENDPOINTS = ["groups", "events", "single_group", "single_event", "batch"]
+
+
+def stats():
+    keys = {}
+    for endpoint in ENDPOINTS:
+        keys[counter_key(endpoint, "hits")] = (endpoint, "hits")
+        keys[counter_key(endpoint, "misses")] = (endpoint, "misses")
+    counters = cache.get_many(keys.keys())
+    result = {endpoint: {"hits": 0, "misses": 0} for endpoint in ENDPOINTS}
+    for key, value in counters.items():
+        endpoint, counter = keys[key]
+        result[endpoint][counter] = value
+    return result
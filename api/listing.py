@@ -0,0 +1,307 @@
+import functools
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from main import pagination, search as full_text
+from main.models import Attendance, Event, Group, Membership, city_key
+
+GROUP_KEYS = ["name", "id"]
+EVENT_KEYS = ["date", "time", "id"]
+
+GROUP_FIELDS = ["name", "slug", "description", "city", "latitude", "longitude"]
+EVENT_FIELDS = [
+    "title",
+    "slug",
+    "details",
+    "date",
+    "time",
+    "venue",
+    "address",
+    "maps_url",
+    "latitude",
+    "longitude",
+]
+
+
+GROUP_LIST_FIELDS = GROUP_FIELDS + ["members_count"]
+EVENT_LIST_FIELDS = EVENT_FIELDS + ["city", "attendees_count"]
+GROUP_DETAIL_FIELDS = GROUP_FIELDS + ["members", "events"]
+EVENT_DETAIL_FIELDS = EVENT_FIELDS + ["group", "city", "attendees"]
+
+SEARCH_FIELDS = {
+    "groups": ["name", "slug", "city"],
+    "events": ["title", "slug", "date", "time", "group", "city"],
+    "comments": ["body", "date_posted", "author", "event"],
+}
+
+# Fields read from a related row, and the lookup that selects them.
+COLUMNS = {
+    "city": "city__name",
+    "group": "group__slug",
+    "author": "author__username",
+    "event": "event__slug",
+}
+
+GROUP_INCLUDES = ["members", "events"]
+EVENT_INCLUDES = ["attendees"]
+
+# name: (rows to attach, column pointing at the listed row, value to attach)
+RELATIONS = {
+    "members": (
+        lambda: Membership.objects.order_by("user__username", "id"),
+        "group_id",
+        "user__username",
+    ),
+    "events": (
+        lambda: Event.objects.filter(date__gte=timezone.now().date()).order_by(
+            *EVENT_KEYS
+        ),
+        "group_id",
+        "slug",
+    ),
+    "attendees": (
+        lambda: Attendance.objects.order_by("date_rsvped", "id"),
+        "event_id",
+        "user__username",
+    ),
+}
+
+
+def unique(fields):
+    return list(dict.fromkeys(fields))
+
+
+def requested(request, param, allowed, default=None):
+    """Return the comma-separated names in ?param= that are in `allowed`.
+
+    Unknown names are ignored. Without any known name, `default` is used,
+    which is all of `allowed` unless given.
+    """
+    names = request.GET.get(param, "").split(",")
+    chosen = [name for name in allowed if name in names]
+    if chosen:
+        return chosen
+    return list(allowed if default is None else default)
+
+
+def groups(city=None, fields=GROUP_LIST_FIELDS):
+    groups = Group.objects.all()
+    if city:
+        groups = groups.filter(city__key=city_key(city))
+    return groups.values(*unique(["id"] + GROUP_KEYS + columns(groups, fields)))
+
+
+def events(city=None, fields=EVENT_LIST_FIELDS):
+    now = timezone.now()
+    events = Event.objects.filter(date__gte=now.date())
+    if "city" in fields:
+        events = events.annotate(city=F("group__city__name"))
+    if city:
+        events = events.filter(group__city__key=city_key(city))
+    return events.values(*unique(["id"] + EVENT_KEYS + fields))
+
+
+def search(kind, text):
+    rows = full_text.matches(kind, text)
+    if kind == "events":
+        rows = rows.annotate(city=F("group__city__name"))
+    fields = SEARCH_FIELDS[kind]
+    return rows.values(*unique(["id", "rank"] + columns(rows, fields)))
+
+
+def columns(queryset, fields):
+    """Lookups selecting `fields` from `queryset`, see COLUMNS."""
+    annotations = queryset.query.annotations
+    return [
+        field if field in annotations else COLUMNS.get(field, field) for field in fields
+    ]
+
+
+def first_related(queryset, parent, value, ids, limit):
+    """Yield (parent id, value, total) for the first `limit` rows of each parent.
+
+    Rows are numbered within their parent by a window function and cut in
+    the database, so a parent with many rows costs no more than `limit`.
+    """
+    ordering = [
+        F(key[1:]).desc() if key.startswith("-") else F(key).asc()
+        for key in queryset.query.order_by
+    ]
+    rows = (
+        queryset.filter(**{parent + "__in": ids})
+        .order_by()
+        .annotate(
+            parent_key=F(parent),
+            item=F(value),
+            total=Window(Count("pk"), partition_by=[F(parent)]),
+            place=Window(RowNumber(), partition_by=[F(parent)], order_by=ordering),
+        )
+        .values_list("parent_key", "item", "total", "place")
+    )
+    sql, params = rows.query.sql_with_params()
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s FROM (%s) ranked WHERE %s <= %%s ORDER BY %s"
+            % (
+                ", ".join(quote(name) for name in ["parent_key", "item", "total"]),
+                sql,
+                quote("place"),
+                quote("place"),
+            ),
+            params + (limit,),
+        )
+        yield from cursor
+
+
+def include(rows, names):
+    """Attach each related list in `names` to `rows`, one query per relation.
+
+    Each list holds the first API_INCLUDE_MAX_SIZE items as
+    {"results": [...], "count": total}; the single group and event endpoints
+    page through all of them.
+    """
+    ids = [row["id"] for row in rows]
+    for name in names:
+        queryset, parent, value = RELATIONS[name]
+        related = {pk: {"results": [], "count": 0} for pk in ids}
+        if ids:
+            for pk, item, total in first_related(
+                queryset(), parent, value, ids, settings.API_INCLUDE_MAX_SIZE
+            ):
+                related[pk]["results"].append(item)
+                related[pk]["count"] = total
+        for row in rows:
+            row[name] = related[row["id"]]
+
+
+def project(row, fields):
+    if fields is None:
+        return {key: value for key, value in row.items() if key != "id"}
+    return {
+        field: row[field] if field in row else row[COLUMNS[field]] for field in fields
+    }
+
+
+def slug_list(value):
+    return list(dict.fromkeys(slug for slug in (value or "").split(",") if slug))
+
+
+def batch_size_limit(view):
+    """Reject more than API_BATCH_MAX_SIZE slugs before `view` runs.
+
+    Goes above api.cache.cached, which would otherwise look up a tag
+    version for every slug of an oversized request.
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        slugs = slug_list(request.GET.get("groups")) + slug_list(
+            request.GET.get("events")
+        )
+        if len(slugs) > settings.API_BATCH_MAX_SIZE:
+            return JsonResponse(
+                {"error": "At most %d slugs per batch" % settings.API_BATCH_MAX_SIZE},
+                status=400,
+            )
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def groups_by_slug(slugs):
+    rows = list(
+        Group.objects.filter(slug__in=slugs).values(
+            "id", *columns(Group.objects.all(), GROUP_FIELDS)
+        )
+    )
+    include(rows, GROUP_INCLUDES)
+    return {row["slug"]: project(row, GROUP_DETAIL_FIELDS) for row in rows}
+
+
+def events_by_slug(slugs):
+    rows = list(
+        Event.objects.filter(slug__in=slugs)
+        .annotate(city=F("group__city__name"))
+        .values("id", "group__slug", "city", *EVENT_FIELDS)
+    )
+    include(rows, EVENT_INCLUDES)
+    return {row["slug"]: project(row, EVENT_DETAIL_FIELDS) for row in rows}
+
+
+def page_limit(request):
+    try:
+        limit = int(request.GET.get("limit", settings.API_PAGE_SIZE))
+    except ValueError:
+        limit = settings.API_PAGE_SIZE
+    return max(1, min(limit, settings.API_MAX_PAGE_SIZE))
+
+
+def paginate(
+    request, queryset, keys, cursor_param="cursor", flat=None, fields=None, includes=()
+):
+    """Return a page of `queryset` as {"results": [...], "next": ..., "prev": ...}.
+
+    Rows keep only `fields` plus the related lists named in `includes`; the
+    `id` column is only selected for ordering and includes. With `flat`, each
+    row is reduced to that single field.
+    """
+    rows, next_cursor, prev_cursor = pagination.keyset(
+        queryset, keys, cursor=request.GET.get(cursor_param), limit=page_limit(request)
+    )
+    if flat:
+        results = [row[flat] for row in rows]
+    else:
+        include(rows, includes)
+        output = None if fields is None else list(fields) + list(includes)
+        results = [project(row, output) for row in rows]
+    return {"results": results, "next": next_cursor, "prev": prev_cursor}
+
+
+def wants_stream(request):
+    return request.GET.get("stream") == "1" or ndjson_requested(request)
+
+
+def ndjson_requested(request):
+    return "application/x-ndjson" in request.META.get("HTTP_ACCEPT", "")
+
+
+def stream(request, queryset, keys, fields=None):
+    """Stream every row of `queryset` as a JSON array, or as NDJSON if asked.
+
+    Rows are read through a server-side cursor and written out a chunk at a
+    time, so memory use does not depend on the number of rows.
+    """
+    ndjson = ndjson_requested(request)
+    chunk_size = settings.API_STREAM_CHUNK_SIZE
+    rows = queryset.order_by(*keys).iterator(chunk_size=chunk_size)
+
+    def chunks():
+        encoder = DjangoJSONEncoder()
+        separator = "\n" if ndjson else ","
+        first = True
+        if not ndjson:
+            yield "["
+        buffer = []
+        for row in rows:
+            buffer.append(encoder.encode(project(row, fields)))
+            if len(buffer) == chunk_size:
+                yield ("" if first else separator) + separator.join(buffer)
+                first = False
+                buffer = []
+        if buffer:
+            yield ("" if first else separator) + separator.join(buffer)
+            first = False
+        if ndjson:
+            yield "" if first else "\n"
+        else:
+            yield "]"
+
+    content_type = "application/x-ndjson" if ndjson else "application/json"
+    return StreamingHttpResponse(chunks(), content_type=content_type)
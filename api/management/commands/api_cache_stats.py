@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import cache
+
+
+class Command(BaseCommand):
+    help = "Show API response cache hits and misses per endpoint."
+
+    def handle(self, *args, **options):
+        for endpoint, counters in cache.stats().items():
+            total = counters["hits"] + counters["misses"]
+            ratio = counters["hits"] / total if total else 0
+            self.stdout.write(
+                "%s: %d hits, %d misses (%.0f%% hit rate)"
+                % (endpoint, counters["hits"], counters["misses"], ratio * 100)
+            )
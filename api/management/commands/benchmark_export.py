@@ -0,0 +1,117 @@
+import datetime
+import resource
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import JsonResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from api import listing, views
+from main import cache, changes
+from main.models import City, Event, Group
+
+
+def current_rss():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize()
+
+
+class RSSSampler(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, current_rss())
+            time.sleep(0.01)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return self.peak - self.baseline
+
+
+class Command(BaseCommand):
+    help = "Compare worker RSS of streamed and buffered /api/events/ exports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000000)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        group = self.seed(options["events"])
+        try:
+            self.report("stream=1", self.streamed)
+            self.report("buffered", self.buffered)
+        finally:
+            if not options["keep"]:
+                self.cleanup(group)
+
+    def seed(self, count):
+        group, created = Group.objects.get_or_create(
+            slug="benchmark-export",
+            defaults={"name": "Benchmark export", "city": City.named("Benchmark")},
+        )
+        existing = Event.objects.filter(group=group).count()
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        batch = []
+        for i in range(existing, count):
+            batch.append(
+                Event(
+                    group=group,
+                    title="Synthetic event %d" % i,
+                    slug="benchmark-export-%d" % i,
+                    details="Synthetic event generated by benchmark_export.",
+                    date=tomorrow + datetime.timedelta(days=i % 365),
+                    time=datetime.time(18, 30),
+                    venue="Benchmark hall",
+                )
+            )
+            if len(batch) == 10000:
+                Event.objects.bulk_create(batch)
+                batch = []
+        Event.objects.bulk_create(batch)
+        return group
+
+    def cleanup(self, group):
+        # Like the seeding, delete the events in bulk: Model.delete() would
+        # load them all, send signals for each and write a tombstone per event
+        # into the changes feed, where bulk_create never recorded them. Only
+        # the group, which get_or_create did record, gets its tombstone.
+        with transaction.atomic():
+            events = Event.objects.filter(group=group)
+            events._raw_delete(events.db)
+            tags = cache.tags_for(group)
+            changes.record(group, deleted=True)
+            groups = Group.objects.filter(pk=group.pk)
+            groups._raw_delete(groups.db)
+        cache.invalidate_tags(tags)
+
+    def streamed(self):
+        request = RequestFactory().get("/api/events/", {"stream": "1"})
+        response = views.events(request)
+        return sum(len(chunk) for chunk in response.streaming_content)
+
+    def buffered(self):
+        # What the endpoint did before pagination and streaming.
+        events = listing.events().order_by(*listing.EVENT_KEYS)
+        return len(JsonResponse(list(events), safe=False).content)
+
+    def report(self, name, export):
+        sampler = RSSSampler()
+        sampler.start()
+        start = time.perf_counter()
+        size = export()
+        elapsed = time.perf_counter() - start
+        growth = sampler.stop()
+        self.stdout.write(
+            "%s: %.1f MB written in %.1fs, worker RSS grew by %.1f MB"
+            % (name, size / 2 ** 20, elapsed, growth / 2 ** 20)
+        )
@@ -0,0 +1,216 @@
+from django.db import IntegrityError, transaction
+from django.test import override_settings
+from django.urls import reverse
+
+from main.models import Attendance, Comment, CustomUser, Membership
+from main.tests import TestCase, create_event, create_group
+
+
+class ListQueryTests(TestCase):
+    """List endpoints build their payload in a fixed number of queries."""
+
+    paths = [
+        (reverse("api:groups"), 1),
+        (reverse("api:groups") + "?city=london", 1),
+        (reverse("api:groups") + "?include=members", 2),
+        (reverse("api:events"), 1),
+        (reverse("api:events") + "?city=london", 1),
+        (reverse("api:events") + "?include=attendees", 2),
+    ]
+
+    def seed(self, count):
+        users = [
+            CustomUser.objects.create_user("user%d" % i, "user%d@example.com" % i)
+            for i in range(3)
+        ]
+        for i in range(count):
+            group = create_group("group-%d" % i)
+            event = create_event(group, "event-%d" % i)
+            for user in users:
+                Membership.objects.create(group=group, user=user)
+                Attendance.objects.create(event=event, user=user)
+
+    def assertListQueries(self, count):
+        for path, queries in self.paths:
+            with self.subTest(path=path, rows=count):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()["results"]), count)
+
+    def test_one_row(self):
+        self.seed(1)
+        self.assertListQueries(1)
+
+    def test_many_rows(self):
+        self.seed(20)
+        self.assertListQueries(20)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user", "user@example.com")
+        for i in range(10):
+            group = create_group("group-%d" % i)
+            event = create_event(group, "event-%d" % i)
+            Membership.objects.create(group=group, user=self.user)
+            Attendance.objects.create(event=event, user=self.user)
+
+    def batch(self, count):
+        return self.client.get(
+            reverse("api:batch"),
+            {
+                "groups": ",".join("group-%d" % i for i in range(count)),
+                "events": ",".join("event-%d" % i for i in range(count)),
+            },
+        )
+
+    def test_queries_do_not_grow_with_slugs(self):
+        for count in (1, 10):
+            with self.subTest(count=count), self.assertNumQueries(5):
+                response = self.batch(count)
+            payload = response.json()
+            self.assertEqual(len(payload["groups"]), count)
+            self.assertEqual(len(payload["events"]), count)
+            self.assertEqual(payload["events"]["event-0"]["attendees"]["count"], 1)
+
+    @override_settings(API_BATCH_MAX_SIZE=4)
+    def test_too_many_slugs(self):
+        with self.assertNumQueries(0):
+            response = self.batch(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.batch(2).status_code, 200)
+
+
+class ChangesFeedTests(TestCase):
+    def feed(self, since=None, **params):
+        if since is not None:
+            params["since"] = since
+        response = self.client.get(reverse("api:changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_create_update_delete(self):
+        start = self.feed()["next"]
+        group = create_group()
+        page = self.feed(start)
+        self.assertEqual(
+            [(row["kind"], row["key"]) for row in page["results"]],
+            [("group", str(group.id))],
+        )
+        self.assertEqual(page["results"][0]["data"]["name"], "Group")
+
+        group.name = "Renamed"
+        group.save()
+        page = self.feed(page["next"])
+        self.assertEqual(len(page["results"]), 1)
+        self.assertEqual(page["results"][0]["data"]["name"], "Renamed")
+
+        key = str(group.id)
+        group.delete()
+        page = self.feed(page["next"])
+        self.assertEqual(
+            [(row["key"], row["deleted"], row["data"]) for row in page["results"]],
+            [(key, True, None)],
+        )
+        self.assertEqual(self.feed(page["next"])["results"], [])
+
+    def test_cursor_pages_in_order(self):
+        start = self.feed()["next"]
+        groups = [create_group("group-%d" % i) for i in range(5)]
+        keys, more, since = [], True, start
+        while more:
+            page = self.feed(since, limit=2)
+            self.assertLessEqual(len(page["results"]), 2)
+            keys += [row["key"] for row in page["results"]]
+            more, since = page["more"], page["next"]
+        self.assertEqual(keys, [str(group.id) for group in groups])
+        self.assertEqual(self.feed()["next"], since)
+
+    def test_rolled_back_write_leaves_no_change(self):
+        start = self.feed()["next"]
+        try:
+            with transaction.atomic():
+                create_group()
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        self.assertEqual(self.feed(start)["results"], [])
+
+    def test_invalid_cursor(self):
+        for since in ["12", "bm90IGpzb24", "WyJuIiwgWyJ4IiwgMV1d"]:
+            with self.subTest(since=since):
+                response = self.client.get(reverse("api:changes"), {"since": since})
+                self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user("user", "user@example.com")
+        event = create_event(create_group("django"), "sprint")
+        Comment.objects.create(event=event, author=user, body="Django 2.2?")
+
+    def search(self, **params):
+        return self.client.get(reverse("api:search"), params)
+
+    def test_kinds(self):
+        response = self.search(q="django", type="groups")
+        self.assertEqual(
+            [row["slug"] for row in response.json()["results"]], ["django"]
+        )
+        response = self.search(q="django")
+        self.assertEqual(response.json()["results"], [])
+        response = self.search(q="django", type="comments")
+        self.assertEqual(
+            [
+                (row["body"], row["author"], row["event"])
+                for row in response.json()["results"]
+            ],
+            [("Django 2.2?", "user", "sprint")],
+        )
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.search(type="events").status_code, 400)
+        self.assertEqual(self.search(q="django", type="users").status_code, 400)
+
+
+class NearbyTests(TestCase):
+    def setUp(self):
+        group = create_group()
+        for slug, latitude, longitude in [
+            ("greenwich", 51.4826, -0.0077),
+            ("soho", 51.5136, -0.1365),
+            ("oxford", 51.752, -1.2577),
+        ]:
+            event = create_event(group, slug)
+            event.latitude, event.longitude = latitude, longitude
+            event.save()
+
+    def nearby(self, **params):
+        return self.client.get(reverse("api:events_nearby"), params)
+
+    def test_nearest_first(self):
+        payload = self.nearby(lat=51.508, lon=-0.128, fields="slug").json()
+        self.assertEqual(
+            payload["results"],
+            [
+                {"slug": "soho", "distance_km": 0.857},
+                {"slug": "greenwich", "distance_km": 8.794},
+            ],
+        )
+        self.assertEqual(payload["radius_km"], 25)
+
+    def test_radius_is_capped(self):
+        payload = self.nearby(lat=51.508, lon=-0.128, radius=1000, limit=1).json()
+        self.assertEqual(payload["radius_km"], 100)
+        self.assertEqual([row["slug"] for row in payload["results"]], ["soho"])
+
+    def test_invalid_point(self):
+        for params in [
+            {},
+            {"lat": 51.5},
+            {"lat": 91, "lon": 0},
+            {"lat": "x", "lon": 0},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.nearby(**params).status_code, 400)
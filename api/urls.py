@@ -9,5 +9,9 @@ urlpatterns = [
     path("groups/", views.groups, name="groups"),
     path("groups/<slug:group_slug>/", views.single_group, name="single_group"),
     path("events/", views.events, name="events"),
+    path("events/nearby/", views.events_nearby, name="events_nearby"),
     path("events/<slug:event_slug>/", views.single_event, name="single_event"),
+    path("batch/", views.batch, name="batch"),
+    path("search/", views.search, name="search"),
+    path("changes/", views.changes, name="changes"),
 ]
@@ -1,109 +1,195 @@
-from django.forms.models import model_to_dict
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import render
-from django.utils import timezone
 
-from main.models import Attendance, Event, Group
+from api import cache, listing
+from main import changes as change_feed, conditional, geo
+from main.models import Attendance, CustomUser, Event, Group
+from main.search import RANK_KEYS
 
 
 def docs(request):
     return render(request, "api/docs.html")
 
 
+def group_list(request, city=None):
+    fields = listing.requested(request, "fields", listing.GROUP_LIST_FIELDS)
+    includes = listing.requested(request, "include", listing.GROUP_INCLUDES, default=[])
+    groups = listing.groups(city=city, fields=fields)
+    if listing.wants_stream(request):
+        return listing.stream(request, groups, listing.GROUP_KEYS, fields)
+
+    groups = listing.paginate(
+        request, groups, listing.GROUP_KEYS, fields=fields, includes=includes
+    )
+    return JsonResponse(groups)
+
+
+@conditional.versioned(conditional.groups_version)
+@cache.cached("groups", cache.groups_tags)
 def groups(request):
     if request.GET.get("city"):
         return groups_city(request)
 
-    groups = (
-        Group.objects.all()
-        .order_by("name")
-        .values("name", "slug", "description", "city")
-    )
-    groups_list = list(groups)
-    for group in groups_list:
-        group["members_count"] = Group.objects.get(slug=group["slug"]).members_count
-    return JsonResponse(groups_list, safe=False)
+    return group_list(request)
 
 
 def groups_city(request):
-    city = request.GET.get("city")
-
-    groups = (
-        Group.objects.filter(city=city)
-        .order_by("name")
-        .values("name", "slug", "description", "city")
-    )
-    groups_list = list(groups)
-    for group in groups_list:
-        group["members_count"] = Group.objects.get(slug=group["slug"]).members_count
-    return JsonResponse(groups_list, safe=False)
+    return group_list(request, city=request.GET.get("city"))
 
 
+@conditional.versioned(conditional.group_version)
+@cache.cached("single_group", cache.group_tags)
 def single_group(request, group_slug):
-    group = Group.objects.get(slug=group_slug)
-    group_dict = model_to_dict(group, fields=["name", "slug", "description", "city"])
-    group_dict["members"] = [m.username for m in group.members_list]
-    events = Event.objects.filter(group=group).values_list("slug", flat=True)
-    group_dict["events"] = list(events)
-    return JsonResponse(group_dict, safe=False)
+    fields = listing.requested(request, "fields", listing.GROUP_DETAIL_FIELDS)
+    columns = [field for field in fields if field in listing.GROUP_FIELDS]
+    if "city" in columns:
+        columns[columns.index("city")] = "city__name"
+    group_dict = Group.objects.filter(slug=group_slug).values("id", *columns).first()
+    if group_dict is None:
+        raise Http404("Group not found")
+
+    group_id = group_dict.pop("id")
+    if "city" in fields:
+        group_dict["city"] = group_dict.pop("city__name")
+    if "members" in fields:
+        group_dict["members"] = listing.paginate(
+            request,
+            CustomUser.objects.filter(group=group_id).values("id", "username"),
+            ["username", "id"],
+            cursor_param="members_cursor",
+            flat="username",
+        )
+    if "events" in fields:
+        group_dict["events"] = listing.paginate(
+            request,
+            Event.objects.filter(group=group_id).values("id", "slug", "date", "time"),
+            listing.EVENT_KEYS,
+            cursor_param="events_cursor",
+            flat="slug",
+        )
+    return JsonResponse(group_dict)
 
 
+def event_list(request, city=None):
+    fields = listing.requested(request, "fields", listing.EVENT_LIST_FIELDS)
+    includes = listing.requested(request, "include", listing.EVENT_INCLUDES, default=[])
+    events = listing.events(city=city, fields=fields)
+    if listing.wants_stream(request):
+        return listing.stream(request, events, listing.EVENT_KEYS, fields)
+
+    events = listing.paginate(
+        request, events, listing.EVENT_KEYS, fields=fields, includes=includes
+    )
+    return JsonResponse(events)
+
+
+@conditional.versioned(conditional.events_version)
+@cache.cached("events", cache.events_tags)
 def events(request):
     if request.GET.get("city"):
         return events_city(request)
 
-    now = timezone.now()
-    events = (
-        Event.objects.filter(date__gte=now.date())
-        .order_by("title")
-        .values(
-            "title", "slug", "details", "date", "time", "venue", "address", "maps_url"
-        )
-    )
-    events_list = list(events)
-    for event in events_list:
-        event["city"] = Event.objects.get(slug=event["slug"]).group.city
-        event["attendees_count"] = Event.objects.get(slug=event["slug"]).attendees_count
-    return JsonResponse(events_list, safe=False)
+    return event_list(request)
 
 
 def events_city(request):
-    city = request.GET.get("city")
-
-    now = timezone.now()
-    events = (
-        Event.objects.filter(group__city=city, date__gte=now.date())
-        .order_by("date", "time")
-        .values(
-            "title", "slug", "details", "date", "time", "venue", "address", "maps_url"
+    return event_list(request, city=request.GET.get("city"))
+
+
+def events_nearby(request):
+    found = geo.requested_point(request)
+    if found is None:
+        return JsonResponse(
+            {"error": "?lat= and ?lon= must be valid coordinates"}, status=400
         )
+
+    latitude, longitude, radius = found
+    fields = listing.requested(request, "fields", listing.EVENT_LIST_FIELDS)
+    events = listing.events(fields=fields)
+    rows = geo.nearby(
+        events, latitude, longitude, radius, limit=listing.page_limit(request)
     )
-    events_list = list(events)
-    for event in events_list:
-        event["city"] = Event.objects.get(slug=event["slug"]).group.city
-        event["attendees_count"] = Event.objects.get(slug=event["slug"]).attendees_count
-    return JsonResponse(events_list, safe=False)
+    results = [listing.project(row, fields + ["distance_km"]) for row in rows]
+    return JsonResponse({"results": results, "radius_km": radius})
 
 
+@conditional.versioned(conditional.event_version)
+@cache.cached("single_event", cache.event_tags)
 def single_event(request, event_slug):
-    event = Event.objects.get(slug=event_slug)
-    event_dict = model_to_dict(
-        event,
-        fields=[
-            "title",
-            "slug",
-            "details",
-            "date",
-            "time",
-            "venue",
-            "address",
-            "maps_url",
-        ],
+    fields = listing.requested(request, "fields", listing.EVENT_DETAIL_FIELDS)
+    columns = [field for field in fields if field in listing.EVENT_FIELDS]
+    if "group" in fields:
+        columns.append("group__slug")
+    if "city" in fields:
+        columns.append("group__city__name")
+    event_dict = Event.objects.filter(slug=event_slug).values("id", *columns).first()
+    if event_dict is None:
+        raise Http404("Event not found")
+
+    event_id = event_dict.pop("id")
+    if "group" in fields:
+        event_dict["group"] = event_dict.pop("group__slug")
+    if "city" in fields:
+        event_dict["city"] = event_dict.pop("group__city__name")
+    if "attendees" in fields:
+        event_dict["attendees"] = listing.paginate(
+            request,
+            Attendance.objects.filter(event=event_id).values(
+                "id", "date_rsvped", "user__username"
+            ),
+            ["date_rsvped", "id"],
+            cursor_param="attendees_cursor",
+            flat="user__username",
+        )
+    return JsonResponse(event_dict)
+
+
+@listing.batch_size_limit
+@cache.cached("batch", cache.batch_tags)
+def batch(request):
+    group_slugs = listing.slug_list(request.GET.get("groups"))
+    event_slugs = listing.slug_list(request.GET.get("events"))
+    groups = listing.groups_by_slug(group_slugs) if group_slugs else {}
+    events = listing.events_by_slug(event_slugs) if event_slugs else {}
+    return JsonResponse(
+        {
+            "groups": {slug: groups.get(slug) for slug in group_slugs},
+            "events": {slug: events.get(slug) for slug in event_slugs},
+        }
     )
-    event_dict["group"] = event.group.slug
-    event_dict["city"] = event.group.city
-    attendees = Attendance.objects.filter(event=event).values_list(
-        "user__username", flat=True
+
+
+def search(request):
+    text = request.GET.get("q", "").strip()
+    kind = request.GET.get("type", "events")
+    if not text:
+        return JsonResponse({"error": "Missing ?q="}, status=400)
+    if kind not in listing.SEARCH_FIELDS:
+        return JsonResponse(
+            {"error": "?type= must be one of %s" % ", ".join(listing.SEARCH_FIELDS)},
+            status=400,
+        )
+
+    results = listing.paginate(
+        request,
+        listing.search(kind, text),
+        RANK_KEYS,
+        fields=listing.SEARCH_FIELDS[kind],
     )
-    event_dict["attendees"] = list(attendees)
-    return JsonResponse(event_dict, safe=False)
+    return JsonResponse(results)
+
+
+def changes(request):
+    """Groups, events, memberships and attendances changed after ?since=.
+
+    Without ?since= only the current cursor is returned, to start following
+    the feed after a full export.
+    """
+    since = request.GET.get("since")
+    if not since:
+        return JsonResponse(
+            {"results": [], "next": change_feed.latest(), "more": False}
+        )
+
+    rows, next_since, more = change_feed.page(since, listing.page_limit(request))
+    return JsonResponse({"results": rows, "next": next_since, "more": more})
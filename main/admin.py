@@ -2,7 +2,16 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 from main.forms import CustomUserChangeForm, CustomUserCreationForm
-from main.models import Attendance, Comment, CustomUser, Event, Group, Membership
+from main.models import (
+    Attendance,
+    City,
+    Comment,
+    CustomUser,
+    Event,
+    Group,
+    Membership,
+    OutboundEmail,
+)
 
 
 class CustomUserAdmin(UserAdmin):
@@ -15,6 +24,13 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(CustomUser, CustomUserAdmin)
 
 
+class CityAdmin(admin.ModelAdmin):
+    list_display = ("name", "key", "slug")
+
+
+admin.site.register(City, CityAdmin)
+
+
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("name", "city")
 
@@ -48,3 +64,11 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Comment, CommentAdmin)
+
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("to_email", "subject", "status", "attempts", "send_after")
+    list_filter = ("status",)
+
+
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
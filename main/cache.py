@@ -0,0 +1,213 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from main.models import (
+    Attendance,
+    City,
+    Comment,
+    CustomUser,
+    Event,
+    Group,
+    Membership,
+    city_key,
+)
+
+
+def tag_key(tag):
+    return "tag:" + hashlib.md5(tag.encode()).hexdigest()
+
+
+def tag_versions(tags):
+    """Return the current version of each tag, creating missing ones.
+
+    Cached entries store the versions of the tags they depend on, and are
+    only valid while those versions are unchanged. Invalidating a tag just
+    deletes its version, which works the same on every cache backend.
+    """
+    keys = {tag: tag_key(tag) for tag in tags}
+    versions = cache.get_many(keys.values())
+    for tag, key in keys.items():
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[keys[tag]] for tag in tags]
+
+
+def invalidate_tags(tags):
+    cache.delete_many([tag_key(tag) for tag in tags])
+
+
+def tags_for(instance):
+    """Tags of everything that shows `instance`."""
+    if isinstance(instance, Group):
+        tags = [
+            "cities",
+            "groups",
+            "groups:city:" + instance.city.key,
+            "group:" + instance.slug,
+            "events",
+            "events:city:" + instance.city.key,
+        ]
+        if instance.pk:
+            events = Event.objects.filter(group=instance).values_list("slug", flat=True)
+            tags += ["event:" + slug for slug in events]
+            members = CustomUser.objects.filter(membership__group=instance)
+            usernames = members.values_list("username", flat=True)
+            tags += ["user:" + username for username in usernames]
+        return tags
+    if isinstance(instance, Event):
+        return [
+            "events",
+            "events:city:" + instance.group.city.key,
+            "event:" + instance.slug,
+            "group:" + instance.group.slug,
+        ]
+    if isinstance(instance, Membership):
+        return [
+            "groups",
+            "groups:city:" + instance.group.city.key,
+            "group:" + instance.group.slug,
+            "user:" + instance.user.username,
+        ]
+    if isinstance(instance, Attendance):
+        return [
+            "events",
+            "events:city:" + instance.event.group.city.key,
+            "event:" + instance.event.slug,
+            "group:" + instance.event.group.slug,
+        ]
+    if isinstance(instance, Comment):
+        return ["event:" + instance.event.slug]
+    if isinstance(instance, CustomUser):
+        return ["user:" + instance.username]
+    if isinstance(instance, City):
+        tags = ["cities", "groups:city:" + instance.key, "events:city:" + instance.key]
+        if instance.pk:
+            groups = Group.objects.filter(city=instance).values_list("slug", flat=True)
+            tags += ["group:" + slug for slug in groups]
+            events = Event.objects.filter(group__city=instance)
+            tags += ["event:" + slug for slug in events.values_list("slug", flat=True)]
+            if groups:
+                tags += ["groups", "events"]
+        return tags
+    return []
+
+
+def username_tags(user):
+    """Tags of everything that shows the username of `user`.
+
+    Groups list their members and events their attendees and commenters,
+    and so do the API listings that include them. Only needed when the
+    username changes, unlike every save of the user, e.g. at each login.
+    """
+    groups = Group.objects.filter(membership__user=user).values_list(
+        "slug", "city__key"
+    )
+    events = (
+        Event.objects.filter(Q(attendance__user=user) | Q(comment__author=user))
+        .values_list("slug", "group__city__key")
+        .distinct()
+    )
+    tags = []
+    for slug, key in groups:
+        tags += ["group:" + slug, "groups:city:" + key]
+    for slug, key in events:
+        tags += ["event:" + slug, "events:city:" + key]
+    if groups:
+        tags.append("groups")
+    if events:
+        tags.append("events")
+    return tags
+
+
+def cached_page(tags_func):
+    """Let main.middleware.PageCacheMiddleware cache the view's pages.
+
+    Only pages for anonymous visitors are cached. `tags_func(request, *args,
+    **kwargs)` returns the tags the page depends on, as for api.cache.cached.
+    """
+
+    def decorator(view):
+        view.page_tags = tags_func
+        return view
+
+    return decorator
+
+
+def index_page_tags(request):
+    if request.GET.get("city"):
+        key = city_key(request.GET.get("city"))
+        return ["groups:city:" + key, "events:city:" + key]
+    return ["groups", "events"]
+
+
+def group_page_tags(request, group_slug):
+    return ["group:" + group_slug]
+
+
+def event_page_tags(request, group_slug, event_slug):
+    return ["event:" + event_slug]
+
+
+def profile_page_tags(request, username):
+    return ["user:" + username]
+
+
+def static_page_tags(request):
+    return []
+
+
+def own_groups_key(user_id):
+    return "own-groups:%s" % user_id
+
+
+def own_groups(user_id):
+    """Slugs and names of the groups the user organizes, for the header.
+
+    Cached until main.signals sees one of the user's memberships change or
+    one of those groups is renamed.
+    """
+    key = own_groups_key(user_id)
+    groups = cache.get(key)
+    if groups is None:
+        groups = list(
+            Group.objects.filter(
+                membership__user=user_id, membership__role=Membership.ORGANIZER
+            ).values("slug", "name")
+        )
+        cache.set(key, groups, 60 * 60 * 24)
+    return groups
+
+
+def invalidate_own_groups(user_ids):
+    cache.delete_many([own_groups_key(user_id) for user_id in user_ids])
+
+
+def cities():
+    """Every city with groups, with its number of upcoming events.
+
+    Cached per day, until the "cities" tag is invalidated: by any change to a
+    group or city, but of events only by those adding one, removing one or
+    moving it to another date, see main.signals.
+    """
+    today = timezone.now().date()
+    key = "cities:%s:%s" % (today, tag_versions(["cities"])[0])
+    cities = cache.get(key)
+    if cities is None:
+        cities = list(
+            City.objects.annotate(
+                groups_count=Count("group", distinct=True),
+                upcoming_count=Count(
+                    "group__event", filter=Q(group__event__date__gte=today)
+                ),
+            )
+            .filter(groups_count__gt=0)
+            .order_by("name")
+            .values("name", "slug", "upcoming_count")
+        )
+        cache.set(key, cities, 60 * 60 * 24)
+    return cities
@@ -0,0 +1,154 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from main import pagination
+from main.models import Attendance, Change, Event, Group, Membership
+
+KINDS = {
+    Group: Change.GROUP,
+    Event: Change.EVENT,
+    Membership: Change.MEMBERSHIP,
+    Attendance: Change.ATTENDANCE,
+}
+
+KEYS = ["txid", "id"]
+
+
+def describe(instance):
+    """Return the data the changes feed shows for a row.
+
+    Rows refer to each other by id, which unlike slugs and usernames never
+    changes, and also name them for convenience.
+    """
+    if isinstance(instance, Group):
+        data = {
+            "id": instance.id,
+            "name": instance.name,
+            "slug": instance.slug,
+            "description": instance.description,
+            "city": instance.city.name,
+            "latitude": instance.latitude,
+            "longitude": instance.longitude,
+        }
+        return data
+    if isinstance(instance, Event):
+        data = {
+            "id": instance.id,
+            "title": instance.title,
+            "slug": instance.slug,
+            "details": instance.details,
+            "date": instance.date,
+            "time": instance.time,
+            "venue": instance.venue,
+            "address": instance.address,
+            "maps_url": instance.maps_url,
+            "latitude": instance.latitude,
+            "longitude": instance.longitude,
+            "group_id": instance.group_id,
+            "group": instance.group.slug,
+        }
+        return data
+    if isinstance(instance, Membership):
+        data = {
+            "id": instance.id,
+            "group_id": instance.group_id,
+            "group": instance.group.slug,
+            "user_id": instance.user_id,
+            "user": instance.user.username,
+            "role": instance.role,
+        }
+        return data
+    if isinstance(instance, Attendance):
+        data = {
+            "id": instance.id,
+            "event_id": instance.event_id,
+            "event": instance.event.slug,
+            "user_id": instance.user_id,
+            "user": instance.user.username,
+        }
+        return data
+
+
+def txid():
+    """The id of the transaction writing a change, on PostgreSQL.
+
+    Elsewhere, i.e. on SQLite, writers take turns, so changes commit in the
+    order of their ids and every txid is 0.
+    """
+    return RawSQL("txid_current()" if connection.vendor == "postgresql" else "0", [])
+
+
+def entry(instance, deleted=False):
+    """A Change keyed by the row's id; tombstones need nothing else."""
+    change = Change(
+        kind=KINDS[type(instance)], key=str(instance.pk), deleted=deleted, txid=txid()
+    )
+    if not deleted:
+        change.data = json.dumps(describe(instance), cls=DjangoJSONEncoder)
+    return change
+
+
+def record(instance, deleted=False):
+    record_many([instance], deleted=deleted)
+
+
+def record_many(instances, deleted=False):
+    """Write changes in the transaction that changed `instances`.
+
+    A rolled back write takes its changes with it, and a committed one
+    cannot lose them. Views wrap their saves in transaction.atomic for
+    this, as post_save is sent after an autocommitted save has committed.
+    """
+    Change.objects.bulk_create(
+        [entry(instance, deleted=deleted) for instance in instances]
+    )
+
+
+def visible():
+    """Changes that no transaction still running can be ordered before.
+
+    Ids and txids are handed out before commit, so a change may commit after
+    one that follows it in the feed. On PostgreSQL only changes of
+    transactions older than the oldest one running are shown: all of them
+    have committed, and any change committed later sorts after them. A long
+    running transaction holds the feed back, but never makes it skip.
+    """
+    changes = Change.objects.all()
+    if connection.vendor == "postgresql":
+        horizon = RawSQL("txid_snapshot_xmin(txid_current_snapshot())", [])
+        changes = changes.filter(txid__lt=horizon)
+    return changes
+
+
+def cursor(row):
+    return pagination.encode_cursor(pagination.NEXT, [row["txid"], row["id"]])
+
+
+def latest():
+    """The cursor of the last visible change, to follow the feed from now."""
+    row = visible().order_by("-txid", "-id").values("txid", "id").first()
+    return cursor(row or {"txid": 0, "id": 0})
+
+
+def page(since, limit):
+    """The changes after cursor `since`, oldest first.
+
+    Returns them, the cursor to ask for the next ones with, and whether
+    there are more already. Raises InvalidCursor for a bad `since`.
+    """
+    rows, next_cursor, prev_cursor = pagination.keyset(
+        visible().values(
+            "txid", "id", "kind", "key", "deleted", "data", "date_changed"
+        ),
+        KEYS,
+        cursor=since,
+        limit=limit,
+    )
+    next_since = cursor(rows[-1]) if rows else since
+    for row in rows:
+        del row["txid"]
+        row["data"] = json.loads(row["data"]) if row["data"] else None
+    return rows, next_since, next_cursor is not None
@@ -0,0 +1,136 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from main.cache import tag_versions
+from main.models import CustomUser, city_key
+
+
+def tags_version(tags):
+    """The versions of `tags`, as an ETag's extra part; see main.cache.
+
+    main.signals invalidates the tags of everything a save or delete shows
+    in, renames of users and cities included, so this changes whenever the
+    response would. It is read from the cache: no query, however many rows
+    the response lists.
+    """
+    return None, ":".join(tag_versions(tags))
+
+
+def group_version(request, group_slug):
+    return tags_version(["group:" + group_slug])
+
+
+def event_version(request, event_slug, group_slug=None):
+    return tags_version(["event:" + event_slug])
+
+
+def groups_version(request):
+    if request.GET.get("city"):
+        return tags_version(["groups:city:" + city_key(request.GET.get("city"))])
+    return tags_version(["groups"])
+
+
+def events_version(request):
+    if request.GET.get("city"):
+        return tags_version(["events:city:" + city_key(request.GET.get("city"))])
+    return tags_version(["events"])
+
+
+def calendar_version(request, token):
+    # One row per RSVP; a cancelled one changes the count.
+    version = CustomUser.objects.filter(calendar_token=token).aggregate(
+        users=Count("id", distinct=True),
+        count=Count("attendance"),
+        rsvped=Max("attendance__date_rsvped"),
+        event=Max("attendance__event__date_updated"),
+        group=Max("attendance__event__group__date_updated"),
+    )
+    if not version["users"]:
+        return None
+    dates = [version["rsvped"], version["event"], version["group"]]
+    return max(filter(None, dates), default=None), version["count"]
+
+
+def etag(request, modified, extra=None):
+    """ETag of a response showing data last modified at `modified`."""
+    if modified is None and extra is None:
+        return None
+    key = "%s|%s|%s|%s" % (
+        modified.isoformat() if modified else "",
+        extra,
+        timezone.now().date(),
+        request.get_full_path(),
+    )
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def versioned(version_func):
+    """Answer conditional GETs from `version_func` before running the view.
+
+    `version_func(request, *args, **kwargs)` returns the last modification
+    time of everything the response shows, or a (last modified, extra) tuple
+    when that alone cannot tell changes apart, e.g. when rows were deleted
+    or the version is made of tag versions; such responses only get an
+    ETag. It is called once per request. Today's date is part of the ETag
+    because the views split upcoming and past events on it.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version = version_func(request, *args, **kwargs)
+            if isinstance(version, tuple):
+                modified, extra = version
+            else:
+                modified, extra = version, None
+
+            def etag_func(request, *args, **kwargs):
+                return etag(request, modified, extra)
+
+            def last_modified(request, *args, **kwargs):
+                return modified if extra is None else None
+
+            conditional_view = condition(
+                etag_func=etag_func, last_modified_func=last_modified
+            )
+            response = conditional_view(view)(request, *args, **kwargs)
+            patch_cache_control(
+                response, public=True, max_age=settings.PUBLIC_CACHE_MAX_AGE
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def versioned_page(version_func):
+    """Like `versioned`, for HTML pages that differ per visitor.
+
+    Only anonymous visitors without pending flash messages get conditional
+    and publicly cacheable responses. Everyone else gets a fresh, private
+    render.
+    """
+
+    def decorator(view):
+        anonymous_view = versioned(version_func)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated or "messages" in request.COOKIES:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+            else:
+                response = anonymous_view(request, *args, **kwargs)
+            patch_vary_headers(response, ["Cookie"])
+            return response
+
+        return wrapper
+
+    return decorator
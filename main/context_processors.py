@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from main import cache
+
+
+def own_groups(request):
+    """Groups the user organizes, for the "my groups" header.
+
+    Lazy, so pages that do not show the header never touch the cache.
+    """
+    if not request.user.is_authenticated:
+        return {"own_groups": None}
+    user_id = request.user.pk
+    return {"own_groups": SimpleLazyObject(lambda: cache.own_groups(user_id))}
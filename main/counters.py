@@ -0,0 +1,45 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from main.models import Attendance, Comment, CustomUser, Event, Group, Membership
+
+# (model, counter column, counted model, its foreign key to model, condition)
+COUNTERS = [
+    (Group, "members_count", Membership, "group", Q()),
+    (Group, "organizers_count", Membership, "group", Q(role=Membership.ORGANIZER)),
+    (Event, "attendees_count", Attendance, "event", Q()),
+    (Event, "comments_count", Comment, "event", Q()),
+    (CustomUser, "member_of_count", Membership, "user", Q(role=Membership.MEMBER)),
+]
+
+
+def counted(model, foreign_key, condition):
+    rows = (
+        model.objects.filter(condition, **{foreign_key: OuterRef("pk")})
+        .order_by()
+        .values(foreign_key)
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile():
+    """Recount every counter column that has drifted from the real count.
+
+    Returns {"Model.column": number of rows fixed}. Each fix is a single
+    UPDATE that recounts in the database, so writes racing with it are not
+    lost.
+    """
+    fixed = {}
+    for model, column, counted_model, foreign_key, condition in COUNTERS:
+        actual = counted(counted_model, foreign_key, condition)
+        drifted = list(
+            model.objects.annotate(actual=actual)
+            .exclude(**{column: F("actual")})
+            .values_list("pk", flat=True)
+        )
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(**{column: actual})
+        fixed[model.__name__ + "." + column] = len(drifted)
+    return fixed
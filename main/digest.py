@@ -0,0 +1,109 @@
+import datetime
+import itertools
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.utils import timezone
+
+from main import outbox
+from main.models import Membership, OutboundEmail
+
+COLUMNS = [
+    "user_id",
+    "user__email",
+    "user__username",
+    "group__name",
+    "group__slug",
+    "group__event__title",
+    "group__event__slug",
+    "group__event__date",
+    "group__event__time",
+    "group__event__venue",
+]
+
+
+def next_run(now=None):
+    now = now or timezone.now()
+    days = (settings.DIGEST_WEEKDAY - now.weekday()) % 7
+    run = now.replace(hour=settings.DIGEST_HOUR, minute=0, second=0, microsecond=0)
+    run += datetime.timedelta(days=days)
+    if run <= now:
+        run += datetime.timedelta(days=7)
+    return run
+
+
+def covers(date):
+    """Whether a digest still to be sent will list events on `date`."""
+    return date >= next_run().date()
+
+
+def rows(start, end):
+    """One row per subscriber and event of their groups between the dates.
+
+    Rows come ordered by subscriber, then by event time, from a single query
+    read EMAIL_BATCH_SIZE rows at a time.
+    """
+    return (
+        Membership.objects.filter(
+            user__weekly_digest=True,
+            group__event__date__gte=start,
+            group__event__date__lt=end,
+        )
+        .exclude(user__email="")
+        .order_by(
+            "user_id", "group__event__date", "group__event__time", "group__event__id"
+        )
+        .values_list(*COLUMNS)
+        .iterator(chunk_size=settings.EMAIL_BATCH_SIZE)
+    )
+
+
+def queue(start):
+    """Queue the digests of the DIGEST_DAYS starting on `start`.
+
+    Subscribers are handled one at a time as their rows stream in, and
+    messages are queued a batch at a time, so memory use does not depend on
+    the number of subscribers. Returns the number of digests queued.
+    """
+    end = start + datetime.timedelta(days=settings.DIGEST_DAYS)
+    template = get_template("main/weekly_digest_email.txt")
+    subject = "Your events from %s" % start.strftime("%B %-d")
+    batch, count = [], 0
+    for user_id, user_rows in itertools.groupby(rows(start, end), lambda row: row[0]):
+        events = [dict(zip(COLUMNS, row)) for row in user_rows]
+        first = events[0]
+        body = template.render(
+            {
+                "start": start,
+                "end": end - datetime.timedelta(days=1),
+                "site_url": settings.SITE_URL,
+                "username": first["user__username"],
+                "events": [
+                    {
+                        "title": event["group__event__title"],
+                        "slug": event["group__event__slug"],
+                        "date": event["group__event__date"],
+                        "time": event["group__event__time"],
+                        "venue": event["group__event__venue"],
+                        "group_name": event["group__name"],
+                        "group_slug": event["group__slug"],
+                    }
+                    for event in events
+                ],
+            }
+        )
+        batch.append(
+            OutboundEmail(
+                key="digest:%s:%d" % (start.isoformat(), user_id),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to_email=first["user__email"],
+                subject=subject,
+                body=body,
+            )
+        )
+        count += 1
+        if len(batch) == settings.EMAIL_BATCH_SIZE:
+            outbox.enqueue(batch)
+            batch = []
+    outbox.enqueue(batch)
+    return count
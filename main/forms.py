@@ -13,25 +13,66 @@ class CustomUserCreationForm(UserCreationForm):
 class CustomUserChangeForm(UserChangeForm):
     class Meta:
         model = models.CustomUser
-        fields = ["username", "email", "about"]
+        fields = ["username", "email", "about", "weekly_digest"]
 
 
-class GroupCreationForm(forms.ModelForm):
+class CityField(forms.CharField):
+    """A city typed by name, cleaned to the City it names.
+
+    A city not seen before is cleaned to an unsaved City, created when the
+    group is saved.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(max_length=100, **kwargs)
+
+    def clean(self, value):
+        value = super().clean(value)
+        if not models.city_key(value):
+            raise forms.ValidationError("Enter a city name.")
+        return models.City.find(value)
+
+
+class GroupForm(forms.ModelForm):
+    city = CityField()
+
+    def save(self, commit=True):
+        # city is left out of Meta.fields: a new, unsaved City would fail the
+        # model's validation, which only sees the missing city_id.
+        self.instance.city = self.cleaned_data["city"]
+        return super().save(commit)
+
+
+class GroupCreationForm(GroupForm):
     class Meta:
         model = models.Group
-        fields = ["name", "description", "city"]
+        fields = ["name", "description", "latitude", "longitude"]
 
 
-class GroupChangeForm(forms.ModelForm):
+class GroupChangeForm(GroupForm):
     class Meta:
         model = models.Group
-        fields = ["name", "slug", "description", "city"]
+        fields = ["name", "slug", "description", "latitude", "longitude"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial["city"] = self.instance.city.name
 
 
 class EventCreationForm(forms.ModelForm):
     class Meta:
         model = models.Event
-        fields = ["title", "details", "date", "time", "venue", "address", "maps_url"]
+        fields = [
+            "title",
+            "details",
+            "date",
+            "time",
+            "venue",
+            "address",
+            "maps_url",
+            "latitude",
+            "longitude",
+        ]
 
 
 class EventChangeForm(forms.ModelForm):
@@ -46,6 +87,8 @@ class EventChangeForm(forms.ModelForm):
             "venue",
             "address",
             "maps_url",
+            "latitude",
+            "longitude",
         ]
 
 
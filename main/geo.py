@@ -0,0 +1,145 @@
+import math
+import re
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+
+# The world is cut into cells of CELL_DEGREES by CELL_DEGREES, numbered row
+# by row from the south-west corner. A radius query reads a few contiguous
+# ranges of cell numbers from a B-tree index, then measures actual distances.
+CELL_DEGREES = 0.1
+COLUMNS = int(360 / CELL_DEGREES)
+ROWS = int(180 / CELL_DEGREES)
+
+# Coordinates in the maps links people paste: Google Maps (/@lat,lon, ?q=,
+# ?ll=, ?query=, ?center=, ?destination=), OpenStreetMap (?mlat=&mlon=,
+# #map=zoom/lat/lon) and Apple Maps (?ll=, ?q=).
+NUMBER = r"(-?\d{1,3}(?:\.\d+)?)"
+MAPS_URL_PATTERNS = [
+    re.compile(r"@" + NUMBER + r"," + NUMBER),
+    re.compile(
+        r"[?&](?:q|ll|query|center|destination|sll)=" + NUMBER + r",\s*" + NUMBER
+    ),
+    re.compile(r"[?&]mlat=" + NUMBER + r"&mlon=" + NUMBER),
+    re.compile(r"#map=\d+/" + NUMBER + r"/" + NUMBER),
+]
+
+
+def valid(latitude, longitude):
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+def parse_maps_url(url):
+    """Return (latitude, longitude) found in a maps link, or None."""
+    url = unquote(url or "")
+    for pattern in MAPS_URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            latitude, longitude = float(match.group(1)), float(match.group(2))
+            if valid(latitude, longitude):
+                return latitude, longitude
+    return None
+
+
+def requested_point(request):
+    """Return (latitude, longitude, radius in km) from ?lat=&lon=&radius=.
+
+    Returns None unless both coordinates are valid. The radius defaults to
+    NEARBY_RADIUS_KM and is capped at NEARBY_MAX_RADIUS_KM.
+    """
+    try:
+        latitude = float(request.GET["lat"])
+        longitude = float(request.GET["lon"])
+        radius = float(request.GET.get("radius", settings.NEARBY_RADIUS_KM))
+    except (KeyError, ValueError):
+        return None
+    if not valid(latitude, longitude) or not radius > 0:
+        return None
+    return latitude, longitude, min(radius, settings.NEARBY_MAX_RADIUS_KM)
+
+
+def row_of(latitude):
+    return min(int((latitude + 90) / CELL_DEGREES), ROWS - 1)
+
+
+def column_of(longitude):
+    return int((longitude + 180) / CELL_DEGREES) % COLUMNS
+
+
+def cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return row_of(latitude) * COLUMNS + column_of(longitude)
+
+
+def locate(instance):
+    """Fill in coordinates from the maps link, if any, and the grid cell."""
+    coordinates = parse_maps_url(getattr(instance, "maps_url", None))
+    if coordinates:
+        instance.latitude, instance.longitude = coordinates
+    instance.cell = cell(instance.latitude, instance.longitude)
+
+
+def cells_near(latitude, longitude, radius_km):
+    """Q matching the cells within `radius_km` of a point, as index ranges."""
+    degrees = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south = max(latitude - degrees, -90)
+    north = min(latitude + degrees, 90)
+    widest = max(abs(south), abs(north))
+    if widest >= 89.9:
+        spread = 180
+    else:
+        spread = min(degrees / math.cos(math.radians(widest)), 180)
+
+    first, last = column_of(longitude - spread), column_of(longitude + spread)
+    if spread >= 180:
+        spans = [(0, COLUMNS - 1)]
+    elif first <= last:
+        spans = [(first, last)]
+    else:  # crosses the antimeridian
+        spans = [(first, COLUMNS - 1), (0, last)]
+
+    condition = Q()
+    for row in range(row_of(south), row_of(north) + 1):
+        for start, end in spans:
+            condition |= Q(cell__range=(row * COLUMNS + start, row * COLUMNS + end))
+    return condition
+
+
+def distance(latitude, longitude):
+    """Expression of the great-circle distance in km to a point (haversine)."""
+    phi = math.radians(latitude)
+    dphi = Radians("latitude") - phi
+    dlambda = Radians("longitude") - math.radians(longitude)
+    a = Power(Sin(dphi / 2), 2) + (
+        math.cos(phi) * Cos(Radians("latitude")) * Power(Sin(dlambda / 2), 2)
+    )
+    return ExpressionWrapper(
+        2 * EARTH_RADIUS_KM * ASin(Sqrt(Least(a, Value(1.0)))),
+        output_field=FloatField(),
+    )
+
+
+def nearby(queryset, latitude, longitude, radius_km, limit=None):
+    """Rows of `queryset` within `radius_km`, nearest first, with `distance_km`.
+
+    Only rows in the candidate cells are read; the database then measures
+    their distances, drops the corners of the cell ranges and returns the
+    nearest `limit` rows.
+    """
+    rows = list(
+        queryset.filter(cells_near(latitude, longitude, radius_km))
+        .annotate(distance_km=distance(latitude, longitude))
+        .filter(distance_km__lte=radius_km)
+        .order_by("distance_km", "id")[:limit]
+    )
+    for row in rows:
+        if isinstance(row, dict):
+            row["distance_km"] = round(row["distance_km"], 3)
+        else:
+            row.distance_km = round(row.distance_km, 3)
+    return rows
@@ -0,0 +1,150 @@
+import datetime
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from main import conditional
+from main.models import Event, Group
+
+CONTENT_TYPE = "text/calendar; charset=utf-8"
+PRODID = "-//Open Cult//opencult.com//EN"
+
+
+def new_token():
+    return secrets.token_urlsafe(32)
+
+
+def escape(text):
+    """Escape a TEXT value, RFC 5545 section 3.3.11."""
+    text = text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+    return text.replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n")
+
+
+def fold(line):
+    """Split a content line into lines of at most 75 octets, RFC 5545 3.1."""
+    lines, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > 75:
+            lines.append(current)
+            current, size = " ", 1
+        current += char
+        size += width
+    lines.append(current)
+    return "\r\n".join(lines)
+
+
+def utc(moment):
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def event_lines(request, event):
+    url = request.build_absolute_uri(
+        reverse("main:event", args=[event.group.slug, event.slug])
+    )
+    details = "\n\n".join(filter(None, [event.details, url]))
+    location = ", ".join(filter(None, [event.venue, event.address]))
+    lines = [
+        "BEGIN:VEVENT",
+        "UID:event-%d@%s" % (event.id, request.get_host()),
+        "DTSTAMP:" + utc(event.date_updated),
+        "LAST-MODIFIED:" + utc(event.date_updated),
+        # Events are in the local time of their venue: floating times.
+        "DTSTART:"
+        + datetime.datetime.combine(event.date, event.time).strftime("%Y%m%dT%H%M%S"),
+        "SUMMARY:" + escape("%s (%s)" % (event.title, event.group.name)),
+        "DESCRIPTION:" + escape(details),
+        "URL:" + url,
+    ]
+    if location:
+        lines.append("LOCATION:" + escape(location))
+    if event.latitude is not None and event.longitude is not None:
+        lines.append("GEO:%s;%s" % (event.latitude, event.longitude))
+    lines.append("END:VEVENT")
+    return lines
+
+
+def calendar(request, name, events):
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:" + PRODID,
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:" + escape(name),
+    ]
+    for event in events:
+        lines += event_lines(request, event)
+    lines.append("END:VCALENDAR")
+    return "".join(fold(line) + "\r\n" for line in lines)
+
+
+def listed(events):
+    """Events a feed lists: upcoming ones and the last CALENDAR_PAST_DAYS.
+
+    Calendar clients drop events that leave a feed, so recent ones are kept
+    for a while after they happened.
+    """
+    since = timezone.now().date() - datetime.timedelta(days=settings.CALENDAR_PAST_DAYS)
+    return (
+        events.filter(date__gte=since)
+        .select_related("group")
+        .order_by("date", "time", "id")
+    )
+
+
+def group_feed(request, group_slug):
+    events = list(listed(Event.objects.filter(group__slug=group_slug)))
+    if events:
+        name = events[0].group.name
+    else:
+        group = Group.objects.filter(slug=group_slug)
+        name = group.values_list("name", flat=True).first()
+        if name is None:
+            raise Http404("Group not found")
+    return calendar(request, name, events)
+
+
+def user_feed(request, token):
+    events = listed(Event.objects.filter(attendance__user__calendar_token=token))
+    return calendar(request, "Open Cult RSVPs", events)
+
+
+def respond(request, version, build, private=False):
+    """Serve the feed `build()` returns, unless the client has it already.
+
+    `version` is what the `main.conditional` version functions return. The
+    body is cached under its ETag, so after a change it is built once and
+    every poll until the next change costs the version lookup alone.
+    """
+    modified, extra = version if isinstance(version, tuple) else (version, None)
+    etag = quote_etag(conditional.etag(request, modified, extra))
+    last_modified = None
+    if modified is not None and extra is None:
+        last_modified = int(modified.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        key = "ical:" + etag.strip('"')
+        body = cache.get(key)
+        if body is None:
+            body = build()
+            cache.set(key, body, 60 * 60 * 24)
+        response = HttpResponse(body, content_type=CONTENT_TYPE)
+
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, private=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.PUBLIC_CACHE_MAX_AGE
+        )
+    return response
@@ -0,0 +1,141 @@
+import time
+
+from background_task.models import Task
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+
+from main import outbox, tasks
+from main.models import City, CustomUser, Group, Membership, OutboundEmail
+from main.smtp_sink import SMTPSink
+from opencult import settings
+
+SUBJECT = "Announcement from Benchmark announcement"
+KEY = "benchmark-announcement"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-member announcement tasks with a single task queueing "
+        "messages for send_emails, delivering to a local SMTP stand-in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=5000)
+        parser.add_argument(
+            "--connect-delay",
+            type=float,
+            default=0.02,
+            help="Seconds the stand-in takes to accept a connection.",
+        )
+        parser.add_argument(
+            "--message-delay",
+            type=float,
+            default=0.001,
+            help="Seconds the stand-in takes to accept a message.",
+        )
+        parser.add_argument("--connections", type=int, default=4)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        group = self.seed(options["members"])
+        last_task = Task.objects.order_by("-id").values_list("id", flat=True).first()
+        try:
+            with SMTPSink(
+                connect_delay=options["connect_delay"],
+                message_delay=options["message_delay"],
+            ) as sink:
+                smtp = override_settings(
+                    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                    EMAIL_HOST="127.0.0.1",
+                    EMAIL_PORT=sink.port,
+                    EMAIL_USE_TLS=False,
+                    EMAIL_HOST_USER="",
+                    EMAIL_HOST_PASSWORD="",
+                    EMAIL_CONNECTIONS=options["connections"],
+                    EMAIL_RATE_LIMIT=10 ** 6,
+                )
+                with smtp:
+                    self.report("per member", sink, *self.per_member(group))
+                    self.report("queued", sink, *self.queued(group))
+        finally:
+            Task.objects.filter(id__gt=last_task or 0).delete()
+            OutboundEmail.objects.filter(key__startswith=KEY + ":").delete()
+            if not options["keep"]:
+                CustomUser.objects.filter(
+                    username__startswith="benchmark-announcement-"
+                ).delete()
+                group.delete()
+
+    def seed(self, count):
+        group, created = Group.objects.get_or_create(
+            slug="benchmark-announcement",
+            defaults={
+                "name": "Benchmark announcement",
+                "city": City.named("Benchmark"),
+            },
+        )
+        existing = Membership.objects.filter(group=group).count()
+        users = CustomUser.objects.bulk_create(
+            CustomUser(
+                username="benchmark-announcement-%d" % i,
+                email="benchmark-%d@example.com" % i,
+            )
+            for i in range(existing, count)
+        )
+        if users and users[0].pk is None:  # backends without RETURNING
+            users = CustomUser.objects.filter(
+                username__in=[user.username for user in users]
+            )
+        Membership.objects.bulk_create(
+            Membership(group=group, user=user, role=Membership.MEMBER) for user in users
+        )
+        return group
+
+    def body(self, group):
+        return render_to_string(
+            "main/group_announcement_email.txt",
+            {"group_name": group.name, "message": "Benchmark message."},
+        )
+
+    def per_member(self, group):
+        # What the views did before: a render and a task for every member.
+        start = time.perf_counter()
+        emails = []
+        for member in group.members.all():
+            body = self.body(group)
+            tasks.email_async(
+                SUBJECT, body, settings.DEFAULT_FROM_EMAIL, [member.email]
+            )
+            emails.append((body, member.email))
+        queued = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for body, email in emails:
+            tasks.email_async.now(SUBJECT, body, settings.DEFAULT_FROM_EMAIL, [email])
+        return queued, time.perf_counter() - start
+
+    def queued(self, group):
+        start = time.perf_counter()
+        body = self.body(group)
+        tasks.announce(group.id, SUBJECT, body, KEY)
+        queued = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tasks.announce.now(group.id, SUBJECT, body, KEY)
+        outbox.work(once=True)
+        return queued, time.perf_counter() - start
+
+    def report(self, name, sink, queued, delivered):
+        self.stdout.write(
+            "%s: queued in %.2fs, delivered %d messages over %d connections "
+            "in %.2fs"
+            % (
+                name,
+                queued,
+                sink.counts["messages"],
+                sink.counts["connections"],
+                delivered,
+            )
+        )
+        sink.counts = {"connections": 0, "messages": 0}
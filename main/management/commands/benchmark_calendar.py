@@ -0,0 +1,152 @@
+import datetime
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from main import ical
+from main.models import Attendance, City, CustomUser, Event, Group
+
+HOST = "localhost"
+
+
+class Poller(threading.Thread):
+    """Requests calendar feeds every `interval` seconds, like calendar clients."""
+
+    def __init__(self, paths, interval, conditional):
+        super().__init__(daemon=True)
+        self.paths = paths
+        self.interval = interval
+        self.conditional = conditional
+        self.requests = 0
+        self.running = True
+
+    def run(self):
+        client = Client(HTTP_HOST=HOST)
+        etags = {}
+        try:
+            while self.running:
+                for path in self.paths:
+                    headers = {}
+                    if self.conditional and path in etags:
+                        headers["HTTP_IF_NONE_MATCH"] = etags[path]
+                    response = client.get(path, **headers)
+                    etags[path] = response["ETag"]
+                    self.requests += 1
+                    time.sleep(self.interval)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure group page latency while calendar feeds are being polled. "
+        "Everything runs in this process, so run it with --rate near the "
+        "feed requests one worker is expected to serve."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=200)
+        parser.add_argument("--pollers", type=int, default=8)
+        parser.add_argument(
+            "--rate", type=float, default=50, help="Feed requests per second."
+        )
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--conditional",
+            action="store_true",
+            help="Pollers send If-None-Match, like well-behaved clients.",
+        )
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        group, user = self.seed(options["events"])
+        page = "/%s/" % group.slug
+        feeds = [
+            "/%s/calendar.ics" % group.slug,
+            "/calendar/%s.ics" % user.calendar_token,
+        ]
+        try:
+            self.report("idle", self.latencies(page, options["requests"]))
+            pollers = [
+                Poller(
+                    feeds, options["pollers"] / options["rate"], options["conditional"]
+                )
+                for i in range(options["pollers"])
+            ]
+            start = time.perf_counter()
+            for poller in pollers:
+                poller.start()
+            latencies = self.latencies(page, options["requests"])
+            for poller in pollers:
+                poller.stop()
+            elapsed = time.perf_counter() - start
+            self.report(
+                "%d pollers" % len(pollers),
+                latencies,
+                sum(poller.requests for poller in pollers) / elapsed,
+            )
+        finally:
+            if not options["keep"]:
+                group.delete()
+                user.delete()
+
+    def seed(self, count):
+        group, created = Group.objects.get_or_create(
+            slug="benchmark-calendar",
+            defaults={"name": "Benchmark calendar", "city": City.named("Benchmark")},
+        )
+        user, created = CustomUser.objects.get_or_create(
+            username="benchmark-calendar", defaults={"calendar_token": ical.new_token()}
+        )
+        existing = Event.objects.filter(group=group).count()
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        Event.objects.bulk_create(
+            Event(
+                group=group,
+                title="Synthetic event %d" % i,
+                slug="benchmark-calendar-%d" % i,
+                details="Synthetic event generated by benchmark_calendar.",
+                date=tomorrow + datetime.timedelta(days=i % 365),
+                time=datetime.time(18, 30),
+                venue="Benchmark hall",
+            )
+            for i in range(existing, count)
+        )
+        Attendance.objects.bulk_create(
+            [
+                Attendance(user=user, event=event)
+                for event in Event.objects.filter(group=group).exclude(
+                    attendance__user=user
+                )
+            ]
+        )
+        return group, user
+
+    def latencies(self, path, count):
+        client = Client(HTTP_HOST=HOST)
+        timings = []
+        for i in range(count):
+            start = time.perf_counter()
+            client.get(path)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def report(self, name, latencies, feed_rate=None):
+        latencies = sorted(latencies)
+        line = "%s: group page median %.1f ms, p95 %.1f ms" % (
+            name,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        )
+        if feed_rate is not None:
+            line += ", %.0f feed requests/s" % feed_rate
+        self.stdout.write(line)
@@ -0,0 +1,114 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from api.management.commands.benchmark_export import RSSSampler
+from main import digest
+from main.models import City, CustomUser, Event, Group, Membership, OutboundEmail
+
+PREFIX = "benchmark-digest-"
+
+
+class QueryCounter:
+    """Counts queries without keeping their SQL, unlike CaptureQueriesContext."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Time weekly digest generation and the worker's RSS growth."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100000)
+        parser.add_argument("--groups", type=int, default=2000)
+        parser.add_argument("--memberships", type=int, default=3)
+        parser.add_argument("--events", type=int, default=2)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        start = timezone.now().date()
+        self.seed(start, **options)
+        try:
+            queries = QueryCounter()
+            sampler = RSSSampler()
+            sampler.start()
+            began = time.perf_counter()
+            # With DEBUG on, Django keeps the SQL of the last 9000 queries.
+            with override_settings(DEBUG=False), connection.execute_wrapper(queries):
+                count = digest.queue(start)
+            elapsed = time.perf_counter() - began
+            growth = sampler.stop()
+            self.stdout.write(
+                "%d digests queued in %.1fs with %d queries, "
+                "worker RSS grew by %.1f MB"
+                % (count, elapsed, queries.count, growth / 2 ** 20)
+            )
+        finally:
+            OutboundEmail.objects.filter(
+                key__startswith="digest:%s:" % start.isoformat()
+            ).delete()
+            if not options["keep"]:
+                Group.objects.filter(slug__startswith=PREFIX).delete()
+                CustomUser.objects.filter(username__startswith=PREFIX).delete()
+
+    def seed(self, start, users, groups, memberships, events, **options):
+        if Group.objects.filter(slug__startswith=PREFIX).exists():
+            return
+        began = time.perf_counter()
+        city = City.named("Benchmark")
+        Group.objects.bulk_create(
+            Group(name="Benchmark digest %d" % i, slug=PREFIX + str(i), city=city)
+            for i in range(groups)
+        )
+        group_ids = list(
+            Group.objects.filter(slug__startswith=PREFIX).values_list("id", flat=True)
+        )
+        Event.objects.bulk_create(
+            (
+                Event(
+                    group_id=group_id,
+                    title="Benchmark event %d" % i,
+                    slug="%s%d-%d" % (PREFIX, group_id, i),
+                    date=start + datetime.timedelta(days=i % 7),
+                    time=datetime.time(18, 30),
+                    venue="Benchmark hall",
+                )
+                for group_id in group_ids
+                for i in range(events)
+            ),
+            batch_size=500,
+        )
+        CustomUser.objects.bulk_create(
+            (
+                CustomUser(
+                    username=PREFIX + str(i),
+                    email="%s%d@example.com" % (PREFIX, i),
+                    weekly_digest=True,
+                )
+                for i in range(users)
+            ),
+            batch_size=500,
+        )
+        rng = random.Random(0)
+        user_ids = CustomUser.objects.filter(username__startswith=PREFIX).values_list(
+            "id", flat=True
+        )
+        Membership.objects.bulk_create(
+            (
+                Membership(group_id=group_id, user_id=user_id)
+                for user_id in user_ids.iterator()
+                for group_id in rng.sample(group_ids, memberships)
+            ),
+            batch_size=500,
+        )
+        self.stdout.write("Seeded in %.1fs" % (time.perf_counter() - began))
@@ -0,0 +1,176 @@
+import time
+
+from background_task.models import Task
+from background_task.tasks import tasks as background_tasks
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from main import metrics, outbox
+from main.management.commands.email_stats import report
+from main.models import City, CustomUser, Group, Membership, OutboundEmail
+from main.smtp_sink import SMTPSink
+
+PREFIX = "benchmark-email-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Post a new event and an announcement to a synthetic group and time "
+        "their delivery to a local SMTP stand-in. Everything due in the queue "
+        "is delivered to the stand-in, so run it against a development "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=2000)
+        parser.add_argument(
+            "--connect-delay",
+            type=float,
+            default=0.02,
+            help="Seconds the stand-in takes to accept a connection.",
+        )
+        parser.add_argument(
+            "--message-delay",
+            type=float,
+            default=0.001,
+            help="Seconds the stand-in takes to accept a message.",
+        )
+        parser.add_argument("--connections", type=int, default=4)
+        parser.add_argument(
+            "--min-rate",
+            type=float,
+            default=0,
+            help="Fail if fewer messages a second are delivered.",
+        )
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        group, organizer = self.seed(options["members"])
+        client = Client()
+        client.force_login(organizer)
+        last_task = Task.objects.order_by("-id").values_list("id", flat=True).first()
+        rates = {}
+        try:
+            with SMTPSink(
+                connect_delay=options["connect_delay"],
+                message_delay=options["message_delay"],
+            ) as sink:
+                environment = override_settings(
+                    ALLOWED_HOSTS=["testserver"],
+                    DEBUG=False,
+                    EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                    EMAIL_HOST="127.0.0.1",
+                    EMAIL_PORT=sink.port,
+                    EMAIL_USE_TLS=False,
+                    EMAIL_HOST_USER="",
+                    EMAIL_HOST_PASSWORD="",
+                    EMAIL_CONNECTIONS=options["connections"],
+                    EMAIL_RATE_LIMIT=10 ** 6,
+                )
+                with environment:
+                    today = timezone.now().date()
+                    rates["new_event"] = self.run(
+                        "new_event",
+                        sink,
+                        client,
+                        reverse("main:new_event", args=[group.slug]),
+                        {
+                            "title": "Benchmark event",
+                            "date": today.isoformat(),
+                            "time": "18:30",
+                        },
+                    )
+                    rates["group_announcement"] = self.run(
+                        "group_announcement",
+                        sink,
+                        client,
+                        reverse("main:group_announcement", args=[group.slug]),
+                        {"message": "Benchmark message."},
+                    )
+        finally:
+            Task.objects.filter(id__gt=last_task or 0).delete()
+            OutboundEmail.objects.filter(to_email__startswith=PREFIX).delete()
+            group.event_set.all().delete()
+            if not options["keep"]:
+                CustomUser.objects.filter(username__startswith=PREFIX).delete()
+                group.delete()
+
+        slow = {
+            name: rate for name, rate in rates.items() if rate < options["min_rate"]
+        }
+        if slow:
+            raise CommandError(
+                "Below %g messages a second: %s"
+                % (
+                    options["min_rate"],
+                    ", ".join("%s (%.1f)" % item for item in slow.items()),
+                )
+            )
+
+    def seed(self, count):
+        group, created = Group.objects.get_or_create(
+            slug=PREFIX.rstrip("-"),
+            defaults={"name": "Benchmark email", "city": City.named("Benchmark")},
+        )
+        organizer, created = CustomUser.objects.get_or_create(
+            username=PREFIX + "organizer",
+            defaults={"email": PREFIX + "organizer@example.com"},
+        )
+        Membership.objects.get_or_create(
+            group=group, user=organizer, defaults={"role": Membership.ORGANIZER}
+        )
+        existing = CustomUser.objects.filter(
+            username__startswith=PREFIX, membership__role=Membership.MEMBER
+        ).count()
+        CustomUser.objects.bulk_create(
+            (
+                CustomUser(
+                    username=PREFIX + str(i), email="%s%d@example.com" % (PREFIX, i)
+                )
+                for i in range(existing, count)
+            ),
+            batch_size=500,
+        )
+        Membership.objects.bulk_create(
+            (
+                Membership(group=group, user_id=user_id, role=Membership.MEMBER)
+                for user_id in CustomUser.objects.filter(
+                    username__startswith=PREFIX, membership__isnull=True
+                ).values_list("id", flat=True)
+            ),
+            batch_size=500,
+        )
+        return group, organizer
+
+    def run(self, name, sink, client, path, data):
+        """Post to `path`, deliver what it queued and report the rate."""
+        before = metrics.stats()
+        last_task = Task.objects.order_by("-id").values_list("id", flat=True).first()
+        sink.counts = {"connections": 0, "messages": 0}
+        start = time.perf_counter()
+        response = client.post(path, data)
+        if response.status_code != 302:
+            raise CommandError("%s answered %d" % (path, response.status_code))
+        posted = time.perf_counter() - start
+        for task in Task.objects.filter(id__gt=last_task or 0).order_by("id"):
+            background_tasks.run_task(task)
+        outbox.work(once=True)
+        elapsed = time.perf_counter() - start
+        rate = sink.counts["messages"] / elapsed
+        self.stdout.write(
+            "%s: view answered in %.2fs, %d messages delivered over %d "
+            "connections in %.2fs, %.1f messages a second"
+            % (
+                name,
+                posted,
+                sink.counts["messages"],
+                sink.counts["connections"],
+                elapsed,
+                rate,
+            )
+        )
+        self.stdout.write(report(metrics.difference(metrics.stats(), before)))
+        return rate
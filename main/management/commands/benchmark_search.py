@@ -0,0 +1,144 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import pagination, search
+from main.models import City, Event, Group
+
+TOPICS = [
+    "python",
+    "django",
+    "postgres",
+    "rust",
+    "golang",
+    "javascript",
+    "kubernetes",
+    "security",
+    "design",
+    "startups",
+    "photography",
+    "chess",
+    "running",
+    "climbing",
+    "cooking",
+    "poetry",
+    "jazz",
+    "astronomy",
+    "robotics",
+    "gardening",
+]
+WORDS = [
+    "introduction",
+    "workshop",
+    "advanced",
+    "hands-on",
+    "evening",
+    "talks",
+    "beginners",
+    "social",
+    "hack",
+    "night",
+    "study",
+    "group",
+    "lightning",
+    "panel",
+    "open",
+    "session",
+]
+
+
+class Command(BaseCommand):
+    help = "Time search queries over a synthetic corpus of events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000000)
+        parser.add_argument("--runs", type=int, default=20)
+        parser.add_argument(
+            "--terms", nargs="+", default=["python", "django workshop", "jazz night"]
+        )
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        if not search.full_text():
+            self.stdout.write("Not on PostgreSQL: timing the substring fallback.")
+        group = self.seed(options["events"])
+        try:
+            for term in options["terms"]:
+                self.report(term, options["runs"])
+        finally:
+            if not options["keep"]:
+                group.delete()
+
+    def seed(self, count):
+        group, created = Group.objects.get_or_create(
+            slug="benchmark-search",
+            defaults={"name": "Benchmark search", "city": City.named("Benchmark")},
+        )
+        existing = Event.objects.filter(group=group).count()
+        if existing >= count:
+            return group
+
+        rng = random.Random(existing)
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        start = time.perf_counter()
+        batch = []
+        for i in range(existing, count):
+            topic = rng.choice(TOPICS)
+            batch.append(
+                Event(
+                    group=group,
+                    title="%s %s %s" % (topic, rng.choice(WORDS), rng.choice(WORDS)),
+                    slug="benchmark-search-%d" % i,
+                    details=" ".join(rng.choice(WORDS + TOPICS) for _ in range(30)),
+                    date=tomorrow + datetime.timedelta(days=i % 365),
+                    time=datetime.time(18, 30),
+                    venue="%s hall" % rng.choice(TOPICS),
+                )
+            )
+            if len(batch) == 10000:
+                Event.objects.bulk_create(batch)
+                batch = []
+        Event.objects.bulk_create(batch)
+
+        # bulk_create skips the signals that keep search vectors up to date.
+        if search.full_text():
+            model, fields = search.KINDS["events"]
+            Event.objects.filter(group=group).update(search=search.vector(fields))
+        self.stdout.write(
+            "Seeded %d events in %.1fs"
+            % (count - existing, time.perf_counter() - start)
+        )
+        return group
+
+    def report(self, term, runs):
+        rows = search.matches("events", term)
+        first, deep = [], []
+        cursor = None
+        for run in range(runs):
+            start = time.perf_counter()
+            page, next_cursor, prev_cursor = pagination.keyset(
+                rows, search.RANK_KEYS, limit=50
+            )
+            first.append(time.perf_counter() - start)
+            cursor = cursor or next_cursor
+            if cursor:
+                start = time.perf_counter()
+                page, cursor, prev_cursor = pagination.keyset(
+                    rows, search.RANK_KEYS, cursor=cursor, limit=50
+                )
+                deep.append(time.perf_counter() - start)
+
+        self.stdout.write(
+            "%r: %d matches, first page %.1f ms, following pages %s (median of %d)"
+            % (
+                term,
+                rows.count(),
+                statistics.median(first) * 1000,
+                "%.1f ms" % (statistics.median(deep) * 1000) if deep else "n/a",
+                runs,
+            )
+        )
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from main import metrics
+from main.models import OutboundEmail
+
+PERCENTILES = [0.5, 0.9, 0.99]
+
+
+def upper_bound(name, bound):
+    if bound is None:
+        return "n/a"
+    if bound == float("inf"):
+        return "> %gs" % metrics.HISTOGRAMS[name][-1]
+    return "<= %gs" % bound
+
+
+class Command(BaseCommand):
+    help = "Show the outbound email queue and what the senders counted."
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        queue = OutboundEmail.objects.filter(status=OutboundEmail.PENDING).aggregate(
+            due=Count("id", filter=Q(send_after__lte=now)),
+            waiting=Count("id", filter=Q(send_after__gt=now)),
+            oldest=Min("send_after", filter=Q(send_after__lte=now)),
+        )
+        waited = (now - queue["oldest"]).total_seconds() if queue["oldest"] else 0
+        self.stdout.write(
+            "queue: %d due, oldest due for %ds, %d claimed or waiting to retry"
+            % (queue["due"], waited, queue["waiting"])
+        )
+        self.stdout.write(report(metrics.stats()))
+
+
+def report(stats):
+    lines = [
+        "messages: %d enqueued, %d sent, %d failed, %d retried"
+        % tuple(stats[name] for name in metrics.COUNTERS)
+    ]
+    for name in metrics.HISTOGRAMS:
+        lines.append(
+            "%s: %s"
+            % (
+                name,
+                ", ".join(
+                    "p%g %s"
+                    % (
+                        fraction * 100,
+                        upper_bound(
+                            name, metrics.percentile(name, stats[name], fraction)
+                        ),
+                    )
+                    for fraction in PERCENTILES
+                ),
+            )
+        )
+    return "\n".join(lines)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main import counters
+
+
+class Command(BaseCommand):
+    help = "Recount member, organizer, attendee and comment counters that drifted."
+
+    def handle(self, *args, **options):
+        for counter, fixed in counters.reconcile().items():
+            self.stdout.write("%s: %d rows fixed" % (counter, fixed))
@@ -0,0 +1,18 @@
+from background_task.models import Task
+from django.core.management.base import BaseCommand
+
+from main import digest, reminders, tasks
+from opencult import settings
+
+
+class Command(BaseCommand):
+    help = "Schedule the recurring tasks, replacing any earlier schedule."
+
+    def handle(self, *args, **options):
+        run = digest.next_run()
+        tasks.weekly_digest(schedule=run, repeat=Task.WEEKLY)
+        self.stdout.write("Weekly digest scheduled for %s" % run.isoformat())
+
+        run = reminders.next_bucket()
+        tasks.send_reminders(schedule=run, repeat=settings.REMINDER_INTERVAL)
+        self.stdout.write("Reminders scheduled from %s" % run.isoformat())
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main import outbox
+
+
+class Command(BaseCommand):
+    help = "Send the messages in the outbound email queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Stop when no message is due."
+        )
+
+    def handle(self, *args, **options):
+        outbox.work(once=options["once"], stdout=self.stdout)
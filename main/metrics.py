@@ -0,0 +1,98 @@
+import bisect
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from main.models import Metric
+
+COUNTERS = ["enqueued", "sent", "failed", "retried"]
+
+# Upper bounds, in seconds, of the buckets durations are counted in.
+HISTOGRAMS = {
+    "queue_time": [1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600],
+    "smtp_latency": [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+}
+
+
+def add(key, amount=1):
+    """Add `amount` to the Metric called `key`, creating it if new."""
+    if Metric.objects.filter(name=key).update(value=F("value") + amount):
+        return
+    try:
+        with transaction.atomic():
+            Metric.objects.create(name=key, value=amount)
+    except IntegrityError:  # created by another process meanwhile
+        Metric.objects.filter(name=key).update(value=F("value") + amount)
+
+
+def values(keys):
+    """The Metrics called `keys`, by name; those never added to are left out."""
+    return dict(Metric.objects.filter(name__in=keys).values_list("name", "value"))
+
+
+def counter_key(name):
+    return "email-stats:" + name
+
+
+def bucket_key(name, index):
+    return "email-stats:%s:%d" % (name, index)
+
+
+def count(name, amount=1):
+    if amount:
+        add(counter_key(name), amount)
+
+
+def observe(name, durations):
+    """Count each of `durations` in its bucket, one update per bucket."""
+    bounds = HISTOGRAMS[name]
+    buckets = {}
+    for duration in durations:
+        index = bisect.bisect_left(bounds, duration)
+        buckets[index] = buckets.get(index, 0) + 1
+    for index, amount in buckets.items():
+        add(bucket_key(name, index), amount)
+
+
+def stats():
+    """Counters and histogram bucket counts, as kept in the database.
+
+    Bucket counts are listed from the lowest bound up, the last one counting
+    durations above every bound.
+    """
+    keys = [counter_key(name) for name in COUNTERS]
+    for name, bounds in HISTOGRAMS.items():
+        keys += [bucket_key(name, index) for index in range(len(bounds) + 1)]
+    counts = values(keys)
+    result = {name: counts.get(counter_key(name), 0) for name in COUNTERS}
+    for name, bounds in HISTOGRAMS.items():
+        result[name] = [
+            counts.get(bucket_key(name, index), 0) for index in range(len(bounds) + 1)
+        ]
+    return result
+
+
+def difference(after, before):
+    """What was counted between two `stats()` snapshots."""
+    result = {}
+    for name, value in after.items():
+        if isinstance(value, list):
+            result[name] = [a - b for a, b in zip(value, before[name])]
+        else:
+            result[name] = value - before[name]
+    return result
+
+
+def percentile(name, buckets, fraction):
+    """Upper bound of the bucket the `fraction` percentile falls in.
+
+    None if nothing was counted, infinity if it falls above every bound.
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    seen = 0
+    for bound, amount in zip(HISTOGRAMS[name] + [float("inf")], buckets):
+        seen += amount
+        if seen >= fraction * total:
+            return bound
@@ -0,0 +1,136 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from main.cache import tag_versions
+
+# Headers a cached page is served with; cookies are never part of an entry.
+STORED_HEADERS = ["Content-Type", "ETag", "Last-Modified", "Cache-Control", "Vary"]
+
+
+def page_key(request):
+    key = "%s|%s|%s" % (
+        request.get_host(),
+        request.get_full_path(),
+        timezone.now().date(),
+    )
+    return "page:" + hashlib.md5(key.encode()).hexdigest()
+
+
+def anonymous(request):
+    # Visitors with flash messages pending get them on their next page.
+    return (
+        request.method in ("GET", "HEAD")
+        and not request.user.is_authenticated
+        and "messages" not in request.COOKIES
+    )
+
+
+def storable(request, response):
+    """Whether the page shows nothing of the visitor's own state."""
+    session = getattr(request, "session", None)
+    return (
+        request.method == "GET"
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get("CSRF_COOKIE_USED")
+        and not (session is not None and session.modified)
+    )
+
+
+def fresh(entry, versions):
+    return (
+        entry is not None
+        and entry["versions"] == versions
+        and entry["expires"] > time.time()
+    )
+
+
+def serve(request, entry, state):
+    response = HttpResponse(entry["content"])
+    for header, value in entry["headers"]:
+        response[header] = value
+    response["X-Cache"] = state
+    last_modified = parse_http_date_safe(response.get("Last-Modified", ""))
+    return get_conditional_response(
+        request,
+        etag=response.get("ETag"),
+        last_modified=last_modified,
+        response=response,
+    )
+
+
+class PageCacheMiddleware:
+    """Serve anonymous visitors the pages of views marked with cached_page.
+
+    Entries remember the versions of the page's tags, see main.cache, and
+    are fresh until one of them is invalidated or PAGE_CACHE_TIMEOUT passes.
+    One request at a time, the one holding the page's lock, renders a page
+    again; meanwhile everyone else is served the stale entry for up to
+    PAGE_CACHE_STALE_TIMEOUT, or waits up to PAGE_CACHE_LOCK_WAIT for the
+    first render of a page nobody has cached yet.
+
+    The lock is taken with cache.add, which memcached does atomically for
+    every process. It is best-effort all the same: memcached may evict it,
+    and it expires after PAGE_CACHE_LOCK_TIMEOUT even if the render is still
+    running. Losing it costs one extra render of the page, never a wrong one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        pending = getattr(request, "_page_cache", None)
+        if pending is not None:
+            key, versions, lock = pending
+            try:
+                if storable(request, response):
+                    entry = {
+                        "content": response.content,
+                        "headers": [
+                            (header, response[header])
+                            for header in STORED_HEADERS
+                            if response.has_header(header)
+                        ],
+                        "versions": versions,
+                        "expires": time.time() + settings.PAGE_CACHE_TIMEOUT,
+                    }
+                    cache.set(key, entry, settings.PAGE_CACHE_STALE_TIMEOUT)
+            finally:
+                cache.delete(lock)
+            response["X-Cache"] = "MISS"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tags_func = getattr(view_func, "page_tags", None)
+        if tags_func is None or not anonymous(request):
+            return None
+
+        versions = tag_versions(tags_func(request, *view_args, **view_kwargs))
+        key = page_key(request)
+        entry = cache.get(key)
+        if fresh(entry, versions):
+            return serve(request, entry, "HIT")
+
+        lock = key + ":lock"
+        if cache.add(lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            request._page_cache = (key, versions, lock)
+            return None
+        if entry is not None:
+            return serve(request, entry, "STALE")
+
+        deadline = time.time() + settings.PAGE_CACHE_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if fresh(entry, versions):
+                return serve(request, entry, "HIT")
+        return None
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.1 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0002_auto_20190531_0300")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attendance",
+            index=models.Index(
+                fields=["event", "date_rsvped", "id"],
+                name="main_attend_event_i_00cd15_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["date", "time", "id"], name="main_event_date_a592cb_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="group",
+            index=models.Index(
+                fields=["name", "id"], name="main_group_name_5569e1_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0003_keyset_indexes")]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="date_updated",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="date_updated",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0004_date_updated")]
+
+    operations = [
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("group", "Group"),
+                            ("event", "Event"),
+                            ("membership", "Membership"),
+                            ("attendance", "Attendance"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                ("key", models.CharField(max_length=255)),
+                ("deleted", models.BooleanField(default=False)),
+                ("data", models.TextField(blank=True, null=True)),
+                (
+                    "date_changed",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+        )
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(apps, schema_editor):
+    Group = apps.get_model("main", "Group")
+    Event = apps.get_model("main", "Event")
+    CustomUser = apps.get_model("main", "CustomUser")
+    Membership = apps.get_model("main", "Membership")
+    Attendance = apps.get_model("main", "Attendance")
+    Comment = apps.get_model("main", "Comment")
+
+    def counted(model, foreign_key, condition=Q()):
+        rows = (
+            model.objects.filter(condition, **{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return Coalesce(Subquery(rows), 0)
+
+    Group.objects.update(
+        members_count=counted(Membership, "group"),
+        organizers_count=counted(Membership, "group", Q(role="organizer")),
+    )
+    Event.objects.update(
+        attendees_count=counted(Attendance, "event"),
+        comments_count=counted(Comment, "event"),
+    )
+    CustomUser.objects.update(
+        member_of_count=counted(Membership, "user", Q(role="member"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0005_change")]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="member_of_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="attendees_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="comments_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="members_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="organizers_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:15
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """Keep one membership per (group, user) and one attendance per (user, event).
+
+    A member added as organizer got a second row; the organizer row is kept.
+    Otherwise the earliest row is kept. Counters are recounted afterwards.
+    """
+    Group = apps.get_model("main", "Group")
+    Event = apps.get_model("main", "Event")
+    CustomUser = apps.get_model("main", "CustomUser")
+    Membership = apps.get_model("main", "Membership")
+    Attendance = apps.get_model("main", "Attendance")
+
+    def duplicated(model, fields):
+        return (
+            model.objects.order_by()
+            .values(*fields)
+            .annotate(rows=Count("id"))
+            .filter(rows__gt=1)
+        )
+
+    for pair in duplicated(Membership, ["group", "user"]):
+        rows = Membership.objects.filter(group=pair["group"], user=pair["user"])
+        keep = min(rows, key=lambda m: (m.role != "organizer", m.date_joined, m.id))
+        rows.exclude(id=keep.id).delete()
+    for pair in duplicated(Attendance, ["user", "event"]):
+        rows = Attendance.objects.filter(user=pair["user"], event=pair["event"])
+        keep = rows.order_by("date_rsvped", "id").first()
+        rows.exclude(id=keep.id).delete()
+
+    def counted(model, foreign_key, condition=Q()):
+        rows = (
+            model.objects.filter(condition, **{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return Coalesce(Subquery(rows), 0)
+
+    Group.objects.update(
+        members_count=counted(Membership, "group"),
+        organizers_count=counted(Membership, "group", Q(role="organizer")),
+    )
+    Event.objects.update(attendees_count=counted(Attendance, "event"))
+    CustomUser.objects.update(
+        member_of_count=counted(Membership, "user", Q(role="member"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0006_counters")]
+
+    operations = [migrations.RunPython(remove_duplicates, migrations.RunPython.noop)]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0007_remove_duplicates")]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["event", "date_posted", "id"],
+                name="main_commen_event_i_ba6b82_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["group", "date", "time", "id"],
+                name="main_event_group_i_7358be_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="group",
+            index=models.Index(
+                fields=["city", "name", "id"], name="main_group_city_8b1a97_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="membership",
+            index=models.Index(
+                fields=["user", "role"], name="main_member_user_id_c5d297_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="membership",
+            index=models.Index(
+                condition=models.Q(role="organizer"),
+                fields=["group"],
+                name="main_membership_organizer_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="attendance",
+            constraint=models.UniqueConstraint(
+                fields=("user", "event"), name="main_attendance_user_event_uniq"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="membership",
+            constraint=models.UniqueConstraint(
+                fields=("group", "user"), name="main_membership_group_user_uniq"
+            ),
+        ),
+    ]
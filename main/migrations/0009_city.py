@@ -0,0 +1,41 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0008_query_indexes")]
+
+    operations = [
+        migrations.CreateModel(
+            name="City",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("key", models.CharField(max_length=100, unique=True)),
+                ("slug", models.CharField(max_length=100, unique=True)),
+            ],
+            options={"verbose_name_plural": "cities"},
+        ),
+        migrations.RemoveIndex(model_name="group", name="main_group_city_8b1a97_idx"),
+        migrations.RenameField(
+            model_name="group", old_name="city", new_name="city_name"
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="city",
+            field=models.ForeignKey(
+                null=True, on_delete=django.db.models.deletion.PROTECT, to="main.City"
+            ),
+        ),
+    ]
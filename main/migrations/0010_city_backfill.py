@@ -0,0 +1,52 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:17
+
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.utils.text import slugify
+
+
+def city_key(name):
+    """main.models.city_key as it was when this migration was written."""
+    name = unicodedata.normalize("NFKD", name.split(",")[0])
+    folded = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", folded.casefold()))
+
+
+def create_cities(apps, schema_editor):
+    """Create one City per canonical name and point every group at it.
+
+    Variants such as "London", "london " and "London, UK" become one city,
+    named after its most common spelling.
+    """
+    City = apps.get_model("main", "City")
+    Group = apps.get_model("main", "Group")
+
+    spellings = defaultdict(Counter)
+    for name in Group.objects.values_list("city_name", flat=True):
+        spellings[city_key(name)][name] += 1
+
+    for key, names in spellings.items():
+        name = names.most_common(1)[0][0]
+        city = City.objects.create(
+            name=" ".join(name.split(",")[0].split()),
+            key=key,
+            slug=slugify(key, allow_unicode=True),
+        )
+        Group.objects.filter(city_name__in=list(names)).update(city=city)
+
+
+def restore_city_names(apps, schema_editor):
+    City = apps.get_model("main", "City")
+    Group = apps.get_model("main", "Group")
+    for city in City.objects.all():
+        Group.objects.filter(city=city).update(city_name=city.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0009_city")]
+
+    operations = [migrations.RunPython(create_cities, restore_city_names)]
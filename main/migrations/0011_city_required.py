@@ -0,0 +1,26 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0010_city_backfill")]
+
+    operations = [
+        migrations.RemoveField(model_name="group", name="city_name"),
+        migrations.AlterField(
+            model_name="group",
+            name="city",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, to="main.City"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="group",
+            index=models.Index(
+                fields=["city", "name", "id"], name="main_group_city_id_76e231_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:20
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# table: (model, (field, weight) pairs), as main.search had them here
+VECTORS = {
+    "main_group": ("Group", (("name", "A"), ("description", "B"))),
+    "main_event": ("Event", (("title", "A"), ("venue", "B"), ("details", "C"))),
+    "main_comment": ("Comment", (("body", "A"),)),
+}
+
+
+def index_and_fill(apps, schema_editor):
+    # GIN indexes and tsvectors only exist on PostgreSQL; elsewhere the
+    # columns stay empty and main.search falls back to substring matches.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table, (model_name, fields) in VECTORS.items():
+        schema_editor.execute(
+            "CREATE INDEX %s_search_idx ON %s USING gin (search)" % (table, table)
+        )
+        vector = None
+        for field, weight in fields:
+            part = SearchVector(field, weight=weight, config="english")
+            vector = part if vector is None else vector + part
+        apps.get_model("main", model_name).objects.update(search=vector)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for table in VECTORS:
+        schema_editor.execute("DROP INDEX IF EXISTS %s_search_idx" % table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0011_city_required")]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="search",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="search",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="search",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(index_and_fill, drop_indexes),
+    ]
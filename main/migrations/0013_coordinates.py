@@ -0,0 +1,130 @@
+# Generated by Django 2.2.1 on 2026-10-18 16:24
+
+import re
+from urllib.parse import unquote
+
+import django.core.validators
+from django.db import migrations, models
+
+# main.geo as of this migration, which must keep doing the same whatever
+# becomes of it.
+CELL_DEGREES = 0.1
+COLUMNS = int(360 / CELL_DEGREES)
+ROWS = int(180 / CELL_DEGREES)
+
+NUMBER = r"(-?\d{1,3}(?:\.\d+)?)"
+MAPS_URL_PATTERNS = [
+    re.compile(r"@" + NUMBER + r"," + NUMBER),
+    re.compile(
+        r"[?&](?:q|ll|query|center|destination|sll)=" + NUMBER + r",\s*" + NUMBER
+    ),
+    re.compile(r"[?&]mlat=" + NUMBER + r"&mlon=" + NUMBER),
+    re.compile(r"#map=\d+/" + NUMBER + r"/" + NUMBER),
+]
+
+
+def parse_maps_url(url):
+    url = unquote(url or "")
+    for pattern in MAPS_URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            latitude, longitude = float(match.group(1)), float(match.group(2))
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                return latitude, longitude
+    return None
+
+
+def cell(latitude, longitude):
+    row = min(int((latitude + 90) / CELL_DEGREES), ROWS - 1)
+    column = int((longitude + 180) / CELL_DEGREES) % COLUMNS
+    return row * COLUMNS + column
+
+
+def locate_events(apps, schema_editor):
+    Event = apps.get_model("main", "Event")
+    events = Event.objects.exclude(maps_url=None).exclude(maps_url="")
+    for event in events.only("id", "maps_url"):
+        coordinates = parse_maps_url(event.maps_url)
+        if coordinates:
+            Event.objects.filter(pk=event.pk).update(
+                latitude=coordinates[0],
+                longitude=coordinates[1],
+                cell=cell(*coordinates),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0012_search")]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="cell",
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="latitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-90),
+                    django.core.validators.MaxValueValidator(90),
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="longitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-180),
+                    django.core.validators.MaxValueValidator(180),
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="cell",
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="latitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-90),
+                    django.core.validators.MaxValueValidator(90),
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="group",
+            name="longitude",
+            field=models.FloatField(
+                blank=True,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(-180),
+                    django.core.validators.MaxValueValidator(180),
+                ],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                fields=["cell", "date"], name="main_event_cell_bab086_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="group",
+            index=models.Index(fields=["cell"], name="main_group_cell_73ac45_idx"),
+        ),
+        migrations.RunPython(locate_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0013_coordinates")]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="calendar_token",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        )
+    ]
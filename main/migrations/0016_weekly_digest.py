@@ -0,0 +1,16 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0015_outboundemail")]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="weekly_digest",
+            field=models.BooleanField(default=False),
+        )
+    ]
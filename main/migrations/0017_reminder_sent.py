@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0016_weekly_digest")]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="reminder_sent",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(
+                condition=models.Q(reminder_sent=False),
+                fields=["date", "time"],
+                name="main_event_reminder_due_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:45
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def mark_past_events(apps, schema_editor):
+    """Keep events that already happened out of the reminders index."""
+    Event = apps.get_model("main", "Event")
+    Event.objects.filter(date__lt=timezone.now().date()).update(reminder_sent=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0017_reminder_sent")]
+
+    operations = [migrations.RunPython(mark_past_events, migrations.RunPython.noop)]
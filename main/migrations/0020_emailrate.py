@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0018_past_events_reminded")]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailRate",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("host", models.CharField(max_length=255, unique=True)),
+                ("next_send", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        )
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("main", "0021_metric")]
+
+    operations = [
+        migrations.AddField(
+            model_name="change",
+            name="txid",
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="change",
+            index=models.Index(fields=["txid", "id"], name="main_change_cursor_idx"),
+        ),
+    ]
@@ -1,19 +1,41 @@
+import re
+import unicodedata
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 from django.utils import timezone
+from django.utils.text import slugify
+
+
+class CountedModel(models.Model):
+    """A row counted by a counter column on its parent rows.
+
+    main.signals updates the counters when the row is created or deleted;
+    saving in a transaction keeps the row and its counters in step.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class CustomUser(AbstractUser):
     about = models.TextField(blank=True, null=True)
+    member_of_count = models.IntegerField(default=0)
+    calendar_token = models.CharField(
+        max_length=64, unique=True, blank=True, null=True, editable=False
+    )
+    weekly_digest = models.BooleanField(default=False)
 
     @property
     def organizer_of_list(self):
         return self.group_set.filter(membership__role=Membership.ORGANIZER)
 
-    @property
-    def member_of_count(self):
-        return self.group_set.filter(membership__role=Membership.MEMBER).count()
-
     @property
     def member_of_list(self):
         return self.group_set.filter(membership__role=Membership.MEMBER)
@@ -22,26 +44,92 @@ class CustomUser(AbstractUser):
         return self.username
 
 
+def city_key(name):
+    """Canonical form of a city name: "London, UK" and " london" are "london".
+
+    Only the part before the first comma counts. Accents are folded and
+    everything but words is dropped, so the key of a city's slug is its key.
+    """
+    name = unicodedata.normalize("NFKD", name.split(",")[0])
+    folded = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", folded.casefold()))
+
+
+class City(models.Model):
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True)
+    slug = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name_plural = "cities"
+
+    @classmethod
+    def find(cls, name):
+        """Return the City called `name` or a variant of it, unsaved if new."""
+        key = city_key(name)
+        city = cls.objects.filter(key=key).first()
+        if city is None:
+            city = cls(
+                name=" ".join(name.split(",")[0].split()),
+                key=key,
+                slug=slugify(key, allow_unicode=True),
+            )
+        return city
+
+    @classmethod
+    def named(cls, name):
+        """Return the City called `name` or a variant of it, creating it if new."""
+        city = cls.find(name)
+        if city.pk is None:
+            city, created = cls.objects.get_or_create(
+                key=city.key, defaults={"name": city.name, "slug": city.slug}
+            )
+        return city
+
+    def __str__(self):
+        return self.name
+
+
 class Group(models.Model):
     members = models.ManyToManyField(CustomUser, through="Membership")
     name = models.CharField(max_length=100)
     date_created = models.DateTimeField(default=timezone.now)
     slug = models.CharField(max_length=100, unique=True, db_index=True)
     description = models.TextField(blank=True, null=True)
-    city = models.CharField(max_length=100)
+    city = models.ForeignKey(City, on_delete=models.PROTECT)
+    date_updated = models.DateTimeField(auto_now=True)
+    members_count = models.IntegerField(default=0)
+    organizers_count = models.IntegerField(default=0)
+    search = SearchVectorField(null=True, editable=False)
+    latitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    cell = models.IntegerField(null=True, editable=False)
 
-    @property
-    def organizers_count(self):
-        return self.members.filter(membership__role=Membership.ORGANIZER).count()
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["city", "name", "id"]),
+            models.Index(fields=["cell"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        # A city typed into a group form is only created with the group.
+        if self.city_id is None and self.city.pk is None:
+            self.city = City.named(self.city.name)
+        super().save(*args, **kwargs)
 
     @property
     def organizers_list(self):
         return self.members.filter(membership__role=Membership.ORGANIZER)
 
-    @property
-    def members_count(self):
-        return self.members.count()
-
     @property
     def members_list(self):
         return self.members.filter()
@@ -61,10 +149,34 @@ class Event(models.Model):
     venue = models.CharField(max_length=100, blank=True, null=True)
     address = models.CharField(max_length=100, blank=True, null=True)
     maps_url = models.URLField(blank=True, null=True)
+    date_updated = models.DateTimeField(auto_now=True)
+    attendees_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    search = SearchVectorField(null=True, editable=False)
+    latitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
+    )
+    longitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
+    )
+    cell = models.IntegerField(null=True, editable=False)
+    reminder_sent = models.BooleanField(default=False, editable=False)
 
-    @property
-    def attendees_count(self):
-        return self.attendees.count()
+    class Meta:
+        indexes = [
+            models.Index(fields=["date", "time", "id"]),
+            models.Index(fields=["group", "date", "time", "id"]),
+            models.Index(fields=["cell", "date"]),
+            models.Index(
+                fields=["date", "time"],
+                name="main_event_reminder_due_idx",
+                condition=models.Q(reminder_sent=False),
+            ),
+        ]
 
     @property
     def attendees_list(self):
@@ -74,7 +186,7 @@ class Event(models.Model):
         return self.title
 
 
-class Membership(models.Model):
+class Membership(CountedModel):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     date_joined = models.DateTimeField(default=timezone.now)
@@ -84,27 +196,146 @@ class Membership(models.Model):
     ROLE_CHOICES = ((ORGANIZER, "Organizer"), (MEMBER, "Member"))
     role = models.CharField(choices=ROLE_CHOICES, max_length=50, default=MEMBER)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["group", "user"], name="main_membership_group_user_uniq"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "role"]),
+            models.Index(
+                fields=["group"],
+                name="main_membership_organizer_idx",
+                condition=models.Q(role="organizer"),
+            ),
+        ]
+
     def __str__(self):
         return self.group.name + " :: " + self.user.username
 
 
-class Attendance(models.Model):
+class Attendance(CountedModel):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     date_rsvped = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "event"], name="main_attendance_user_event_uniq"
+            )
+        ]
+        indexes = [models.Index(fields=["event", "date_rsvped", "id"])]
+
     def __str__(self):
         return self.user.username + " :: " + self.event.title
 
 
-class Comment(models.Model):
+class Comment(CountedModel):
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     date_posted = models.DateTimeField(default=timezone.now)
     body = models.TextField()
+    search = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["date_posted"]
+        indexes = [models.Index(fields=["event", "date_posted", "id"])]
 
     def __str__(self):
         return self.body[:50] + "(...)"
+
+
+class Change(models.Model):
+    """One entry of the changes feed: a row that was saved or deleted.
+
+    It is written in the transaction that changed the row. The feed is
+    ordered by (txid, id), txid being the id of that transaction on
+    PostgreSQL; see main.changes. `data` holds a JSON snapshot of the row as
+    the API shows it, or is empty for deletes (tombstones).
+    """
+
+    GROUP = "group"
+    EVENT = "event"
+    MEMBERSHIP = "membership"
+    ATTENDANCE = "attendance"
+    KIND_CHOICES = (
+        (GROUP, "Group"),
+        (EVENT, "Event"),
+        (MEMBERSHIP, "Membership"),
+        (ATTENDANCE, "Attendance"),
+    )
+    kind = models.CharField(choices=KIND_CHOICES, max_length=50)
+    key = models.CharField(max_length=255)
+    deleted = models.BooleanField(default=False)
+    data = models.TextField(blank=True, null=True)
+    date_changed = models.DateTimeField(default=timezone.now, db_index=True)
+    txid = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["txid", "id"], name="main_change_cursor_idx")]
+
+    def __str__(self):
+        return self.kind + " :: " + self.key
+
+
+class OutboundEmail(models.Model):
+    """A message waiting in, or sent from, the outbound email queue.
+
+    `key` names the message per recipient, e.g. "event:12:34" for the
+    announcement of event 12 to user 34, so queueing it again is a no-op.
+    Workers claim due messages by pushing `send_after` past the claim
+    timeout; see main.outbox.
+    """
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = ((PENDING, "Pending"), (SENT, "Sent"), (FAILED, "Failed"))
+    status = models.CharField(choices=STATUS_CHOICES, max_length=50, default=PENDING)
+    key = models.CharField(max_length=255, unique=True)
+    from_email = models.CharField(max_length=255)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    date_created = models.DateTimeField(default=timezone.now)
+    date_sent = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["send_after", "id"],
+                name="main_outboundemail_due_idx",
+                condition=models.Q(status="pending"),
+            )
+        ]
+
+    def __str__(self):
+        return self.to_email + " :: " + self.subject
+
+
+class EmailRate(models.Model):
+    """When the next message may go out through an SMTP host.
+
+    Workers lock the row to take the next slot; see main.outbox.RateLimit.
+    """
+
+    host = models.CharField(max_length=255, unique=True)
+    next_send = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.host
+
+
+class Metric(models.Model):
+    """A running count kept by main.metrics, e.g. of email sent."""
+
+    name = models.CharField(max_length=255, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
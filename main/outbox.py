@@ -0,0 +1,231 @@
+import datetime
+import itertools
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main import metrics
+from main.models import EmailRate, OutboundEmail
+
+
+def enqueue(messages):
+    """Add OutboundEmail rows to the queue, skipping keys already queued."""
+    if not messages:
+        return
+    queued = OutboundEmail.objects.filter(
+        key__in=[message.key for message in messages]
+    ).count()
+    OutboundEmail.objects.bulk_create(
+        messages, batch_size=settings.EMAIL_BATCH_SIZE, ignore_conflicts=True
+    )
+    metrics.count("enqueued", len(messages) - queued)
+
+
+def enqueue_to(users, key, subject, body):
+    """Queue the same message for each of `users` that has an address.
+
+    Messages are keyed "<key>:<user id>", so queueing them again is a
+    no-op. Addresses are read and queued EMAIL_BATCH_SIZE at a time.
+    """
+    addresses = (
+        users.exclude(email="")
+        .order_by("id")
+        .values_list("id", "email")
+        .iterator(chunk_size=settings.EMAIL_BATCH_SIZE)
+    )
+    while True:
+        batch = list(itertools.islice(addresses, settings.EMAIL_BATCH_SIZE))
+        if not batch:
+            return
+        enqueue(
+            [
+                OutboundEmail(
+                    key="%s:%d" % (key, user_id),
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to_email=email,
+                    subject=subject,
+                    body=body,
+                )
+                for user_id, email in batch
+            ]
+        )
+
+
+def claim(limit):
+    """Claim up to `limit` due messages for this worker.
+
+    Claimed messages are not due again until EMAIL_CLAIM_TIMEOUT passes, so
+    the messages of a worker that dies are picked up by another one. Rows
+    other workers are claiming are skipped rather than waited for.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, send_after__lte=now)
+            .order_by("send_after", "id")[:limit]
+        )
+        OutboundEmail.objects.filter(
+            pk__in=[message.pk for message in messages]
+        ).update(
+            attempts=F("attempts") + 1,
+            send_after=now + datetime.timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT),
+        )
+    for message in messages:
+        message.attempts += 1
+    return messages
+
+
+def retry_delay(attempts):
+    return datetime.timedelta(seconds=settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def permanent(error):
+    """Whether sending again cannot help, e.g. the address was refused."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def record(results):
+    """Store the outcome of each (message, error or None) pair."""
+    now = timezone.now()
+    sent = [message for message, error in results if error is None]
+    OutboundEmail.objects.filter(pk__in=[message.pk for message in sent]).update(
+        status=OutboundEmail.SENT, date_sent=now, last_error=""
+    )
+    metrics.count("sent", len(sent))
+    metrics.observe(
+        "queue_time", [(now - message.date_created).total_seconds() for message in sent]
+    )
+    for message, error in results:
+        if error is None:
+            continue
+        if permanent(error) or message.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+            changes = {"status": OutboundEmail.FAILED}
+            metrics.count("failed")
+        else:
+            changes = {"send_after": now + retry_delay(message.attempts)}
+            metrics.count("retried")
+        OutboundEmail.objects.filter(pk=message.pk).update(
+            last_error=repr(error), **changes
+        )
+
+
+class RateLimit:
+    """Caps the messages all workers send through EMAIL_HOST each second.
+
+    Messages are spaced 1 / `per_second` seconds apart. Each takes the next
+    free slot from the host's EmailRate row, locked while it is moved on,
+    so workers in every container share one limit. A worker's threads take
+    turns at the row, which also keeps SQLite from refusing their writes.
+    """
+
+    def __init__(self, per_second):
+        self.interval = datetime.timedelta(seconds=1 / per_second)
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock, transaction.atomic():
+            rate, created = EmailRate.objects.select_for_update().get_or_create(
+                host=settings.EMAIL_HOST
+            )
+            slot = max(rate.next_send, timezone.now())
+            rate.next_send = slot + self.interval
+            rate.save(update_fields=["next_send"])
+        delay = (slot - timezone.now()).total_seconds()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Sender:
+    """Sends messages from a pool of threads, one SMTP connection each.
+
+    Connections stay open from one batch to the next, and are opened again
+    after an error. How long the server took to accept each message is kept
+    in `latencies` until the batch is over.
+    """
+
+    def __init__(self, connections, rate_limit):
+        self.pool = ThreadPoolExecutor(max_workers=connections)
+        self.rate_limit = rate_limit
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def send_one(self, message):
+        email = EmailMessage(
+            message.subject, message.body, message.from_email, [message.to_email]
+        )
+        self.rate_limit.wait()
+        while True:
+            reused = getattr(self.local, "connection", None) is not None
+            try:
+                connection = self.connection()
+                start = time.perf_counter()
+                connection.send_messages([email])
+                self.latencies.append(time.perf_counter() - start)
+                return message, None
+            except smtplib.SMTPServerDisconnected as error:
+                # Servers close connections that were idle for too long.
+                self.drop_connection()
+                if not reused:
+                    return message, error
+            except Exception as error:
+                self.drop_connection()
+                return message, error
+
+    def drop_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def send(self, messages):
+        results = list(self.pool.map(self.send_one, messages))
+        metrics.observe("smtp_latency", self.latencies)
+        self.latencies = []
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+        for connection in self.connections:
+            connection.close()
+
+
+def work(once=False, stdout=None):
+    """Send queued messages until stopped, or until none is due if `once`."""
+    sender = Sender(settings.EMAIL_CONNECTIONS, RateLimit(settings.EMAIL_RATE_LIMIT))
+    try:
+        while True:
+            messages = claim(settings.EMAIL_BATCH_SIZE)
+            if not messages:
+                if once:
+                    return
+                time.sleep(settings.EMAIL_POLL_INTERVAL)
+                continue
+            results = sender.send(messages)
+            record(results)
+            if stdout:
+                failed = sum(1 for message, error in results if error)
+                stdout.write("%d sent, %d failed" % (len(results) - failed, failed))
+    finally:
+        sender.close()
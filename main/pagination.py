@@ -0,0 +1,122 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import SuspiciousOperation, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+NEXT = "n"
+PREV = "p"
+
+
+class InvalidCursor(SuspiciousOperation):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds to milliseconds, which would make a cursor
+    # skip or repeat rows that differ only in microseconds.
+    def default(self, o):
+        if isinstance(o, (datetime.date, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], cls=CursorEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    """Return the direction and values of `cursor`, one value per field.
+
+    Values are converted with their field, so a cursor that was tampered
+    with is rejected here rather than failing in the query.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    if direction not in (NEXT, PREV) or not isinstance(values, list):
+        raise InvalidCursor("Invalid cursor")
+    if len(values) != len(fields) or None in values:
+        raise InvalidCursor("Invalid cursor")
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    return direction, values
+
+
+def _field(queryset, key):
+    name = key.lstrip("-")
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _seek(keys, values, forward):
+    """Build the WHERE clause selecting rows strictly after `values`.
+
+    (a, b, c) > (x, y, z) is spelled out as a chain of ORs, with a leading
+    a >= x so the database can seek on an index starting with `a`.
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        field = key.lstrip("-")
+        ascending = (not key.startswith("-")) == forward
+        term = Q(**{field + ("__gt" if ascending else "__lt"): values[i]})
+        for prior, value in zip(keys[:i], values):
+            term &= Q(**{prior.lstrip("-"): value})
+        condition |= term
+    first = keys[0].lstrip("-")
+    ascending = (not keys[0].startswith("-")) == forward
+    return Q(**{first + ("__gte" if ascending else "__lte"): values[0]}) & condition
+
+
+def _reverse(keys):
+    return [key[1:] if key.startswith("-") else "-" + key for key in keys]
+
+
+def _values(row, keys):
+    names = [key.lstrip("-") for key in keys]
+    if isinstance(row, dict):
+        return [row[name] for name in names]
+    return [getattr(row, name) for name in names]
+
+
+def keyset(queryset, keys, cursor=None, limit=50):
+    """Return one page of `queryset` ordered by `keys`, plus next/prev cursors.
+
+    `keys` must make the ordering unique, so end it with the primary key.
+    Pages are fetched by seeking past the last row seen rather than with
+    OFFSET, so every page costs the same.
+    """
+    direction = NEXT
+    if cursor:
+        fields = [_field(queryset, key) for key in keys]
+        direction, values = decode_cursor(cursor, fields)
+        queryset = queryset.filter(_seek(keys, values, direction == NEXT))
+
+    ordering = keys if direction == NEXT else _reverse(keys)
+    rows = list(queryset.order_by(*ordering)[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = prev_cursor = None
+    if direction == NEXT:
+        if has_more:
+            next_cursor = encode_cursor(NEXT, _values(rows[-1], keys))
+        if cursor and rows:
+            prev_cursor = encode_cursor(PREV, _values(rows[0], keys))
+    else:
+        rows.reverse()
+        if has_more:
+            prev_cursor = encode_cursor(PREV, _values(rows[0], keys))
+        if rows:
+            next_cursor = encode_cursor(NEXT, _values(rows[-1], keys))
+
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,64 @@
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from main import outbox
+from main.models import CustomUser, Event
+
+
+def next_bucket(now=None):
+    """Start of the next REMINDER_INTERVAL long slot of the day."""
+    now = now or timezone.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    interval = settings.REMINDER_INTERVAL
+    elapsed = (now - midnight).total_seconds()
+    return midnight + datetime.timedelta(seconds=(elapsed // interval + 1) * interval)
+
+
+def due(now):
+    """Upcoming events starting within REMINDER_HOURS, not reminded yet.
+
+    Event dates and times are wall-clock times without a zone; cities have
+    none, so they are read as TIME_ZONE and `now` is converted to it first.
+    Events far from TIME_ZONE are reminded up to their UTC offset early or
+    late. The date range lets the partial index on unreminded events narrow
+    the scan down to a day or two.
+    """
+    now = timezone.localtime(now)
+    cutoff = now + datetime.timedelta(hours=settings.REMINDER_HOURS)
+    return Event.objects.filter(
+        Q(date__gt=now.date()) | Q(date=now.date(), time__gte=now.time()),
+        Q(date__lt=cutoff.date()) | Q(date=cutoff.date(), time__lte=cutoff.time()),
+        reminder_sent=False,
+        date__range=(now.date(), cutoff.date()),
+    )
+
+
+def remind(event):
+    """Queue a reminder for every attendee of `event`.
+
+    Attendees are queued once per event and start time, so running this
+    again after a crash, before `reminder_sent` was set, sends nobody a
+    second reminder, while a rescheduled event is reminded of again.
+    """
+    body = render_to_string(
+        "main/reminder_email.txt",
+        {"event": event, "group": event.group, "site_url": settings.SITE_URL},
+    )
+    subject = "Reminder: %s on %s" % (event.title, event.date.strftime("%A, %B %-d"))
+    attendees = CustomUser.objects.filter(attendance__event=event)
+    start = datetime.datetime.combine(event.date, event.time)
+    key = "reminder:%d:%s" % (event.id, start.isoformat())
+    outbox.enqueue_to(attendees, key, subject, body)
+    Event.objects.filter(pk=event.pk).update(reminder_sent=True)
+
+
+def queue(now):
+    """Queue the reminders of every due event. Returns how many events."""
+    events = list(due(now).select_related("group__city").order_by("date", "time"))
+    for event in events:
+        remind(event)
+    return len(events)
@@ -0,0 +1,26 @@
+from main.models import Membership
+
+
+def membership(request, group):
+    """Return the current user's Membership of `group`, or None.
+
+    Looked up once per request and group, so views and templates can ask as
+    often as they like.
+    """
+    if not request.user.is_authenticated:
+        return None
+    memberships = request.__dict__.setdefault("_memberships", {})
+    if group.pk not in memberships:
+        memberships[group.pk] = Membership.objects.filter(
+            user=request.user, group=group
+        ).first()
+    return memberships[group.pk]
+
+
+def role(request, group):
+    found = membership(request, group)
+    return found.role if found else None
+
+
+def is_organizer(request, group):
+    return role(request, group) == Membership.ORGANIZER
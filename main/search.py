@@ -0,0 +1,67 @@
+import functools
+import operator
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast
+
+from main.models import Comment, Event, Group
+
+CONFIG = "english"
+
+# kind: (model, (field, weight) pairs making up its search vector)
+KINDS = {
+    "groups": (Group, (("name", "A"), ("description", "B"))),
+    "events": (Event, (("title", "A"), ("venue", "B"), ("details", "C"))),
+    "comments": (Comment, (("body", "A"),)),
+}
+
+RANK_KEYS = ["-rank", "-id"]
+
+
+def full_text():
+    """Whether the database can search the tsvector columns.
+
+    Elsewhere, e.g. on SQLite in development, the columns stay empty and
+    searches fall back to substring matches.
+    """
+    return connection.vendor == "postgresql"
+
+
+def vector(fields):
+    vectors = [
+        SearchVector(field, weight=weight, config=CONFIG) for field, weight in fields
+    ]
+    return functools.reduce(operator.add, vectors)
+
+
+def kind_of(instance):
+    for kind, (model, fields) in KINDS.items():
+        if isinstance(instance, model):
+            return kind
+    return None
+
+
+def update(instance):
+    """Recompute the search vector of a saved row, in the database."""
+    if not full_text():
+        return
+    model, fields = KINDS[kind_of(instance)]
+    model.objects.filter(pk=instance.pk).update(search=vector(fields))
+
+
+def matches(kind, text):
+    """Rows of `kind` matching `text`, annotated with an integer `rank`.
+
+    Ranks are stored in millionths so keyset cursors round-trip exactly.
+    """
+    model, fields = KINDS[kind]
+    if full_text():
+        query = SearchQuery(text, config=CONFIG)
+        rank = Cast(SearchRank(F("search"), query) * 1000000, IntegerField())
+        return model.objects.filter(search=query).annotate(rank=rank)
+
+    terms = [Q(**{field + "__icontains": text}) for field, weight in fields]
+    rows = model.objects.filter(functools.reduce(operator.or_, terms))
+    return rows.annotate(rank=Value(0, IntegerField()))
@@ -0,0 +1,233 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from main import cache, changes, geo, search
+from main.models import Attendance, City, Comment, CustomUser, Event, Group, Membership
+
+
+def touch_group(group_id, **changes):
+    Group.objects.filter(pk=group_id).update(date_updated=timezone.now(), **changes)
+
+
+def touch_event(event_id, **changes):
+    Event.objects.filter(pk=event_id).update(date_updated=timezone.now(), **changes)
+
+
+def adjust_membership_counts(membership, role, step):
+    organizers = step if role == Membership.ORGANIZER else 0
+    touch_group(
+        membership.group_id,
+        members_count=F("members_count") + step,
+        organizers_count=F("organizers_count") + organizers,
+    )
+    if role == Membership.MEMBER:
+        CustomUser.objects.filter(pk=membership.user_id).update(
+            member_of_count=F("member_of_count") + step
+        )
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def update_group_version(sender, instance, **kwargs):
+    touch_group(instance.group_id)
+
+
+@receiver(pre_save, sender=Membership)
+def remember_role(sender, instance, **kwargs):
+    instance._role_before = None
+    if instance.pk:
+        instance._role_before = (
+            Membership.objects.select_for_update()
+            .filter(pk=instance.pk)
+            .values_list("role", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Membership)
+def count_membership(sender, instance, created, **kwargs):
+    if created:
+        adjust_membership_counts(instance, instance.role, 1)
+    elif instance._role_before and instance._role_before != instance.role:
+        adjust_membership_counts(instance, instance._role_before, -1)
+        adjust_membership_counts(instance, instance.role, 1)
+    else:
+        touch_group(instance.group_id)
+
+
+@receiver(pre_delete, sender=Membership)
+@receiver(pre_delete, sender=Attendance)
+@receiver(pre_delete, sender=Comment)
+def lock_counted(sender, instance, **kwargs):
+    # post_delete is sent even if another request deleted the row first, so
+    # only the delete that still finds the row, locked until it commits,
+    # takes it off the counters.
+    instance._counted = (
+        sender.objects.select_for_update().filter(pk=instance.pk).exists()
+    )
+
+
+@receiver(post_delete, sender=Membership)
+def uncount_membership(sender, instance, **kwargs):
+    if instance._counted:
+        adjust_membership_counts(instance, instance.role, -1)
+
+
+@receiver(post_save, sender=Attendance)
+def count_attendance(sender, instance, created, **kwargs):
+    if created:
+        touch_event(instance.event_id, attendees_count=F("attendees_count") + 1)
+    else:
+        touch_event(instance.event_id)
+
+
+@receiver(post_delete, sender=Attendance)
+def uncount_attendance(sender, instance, **kwargs):
+    if instance._counted:
+        touch_event(instance.event_id, attendees_count=F("attendees_count") - 1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        touch_event(instance.event_id, comments_count=F("comments_count") + 1)
+    else:
+        touch_event(instance.event_id)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if instance._counted:
+        touch_event(instance.event_id, comments_count=F("comments_count") - 1)
+
+
+def cache_tags(instance):
+    try:
+        return cache.tags_for(instance)
+    except ObjectDoesNotExist:  # parent already gone in a cascading delete
+        return []
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_save, sender=Event)
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=City)
+def remember_previous(sender, instance, **kwargs):
+    # Renaming a slug, username or city, or moving a group to another city,
+    # must also evict what was cached under the old values.
+    instance._previous = None
+    instance._cache_tags_before = []
+    if instance.pk:
+        instance._previous = sender.objects.filter(pk=instance.pk).first()
+        if instance._previous:
+            instance._cache_tags_before = cache_tags(instance._previous)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_cache(sender, instance, **kwargs):
+    tags = set(cache_tags(instance) + getattr(instance, "_cache_tags_before", []))
+    previous = getattr(instance, "_previous", None)
+    if isinstance(instance, CustomUser) and previous is not None:
+        if previous.username != instance.username:
+            tags.update(cache.username_tags(instance))
+    # The list of cities counts upcoming events, so it changes with an event's
+    # date but not with its other details, attendees or comments.
+    if isinstance(instance, Event):
+        deleted = kwargs["signal"] is post_delete
+        if deleted or previous is None or previous.date != instance.date:
+            tags.add("cities")
+    transaction.on_commit(lambda: cache.invalidate_tags(tags))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Membership)
+@receiver(post_save, sender=Attendance)
+def record_change(sender, instance, **kwargs):
+    changes.record(instance)
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Event)
+@receiver(post_delete, sender=Membership)
+@receiver(post_delete, sender=Attendance)
+def record_deletion(sender, instance, **kwargs):
+    changes.record(instance, deleted=True)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=CustomUser)
+def record_renames(sender, instance, created, **kwargs):
+    # Rows of the feed name the groups, events and users they refer to, so
+    # those naming a renamed one are changed too.
+    previous = getattr(instance, "_previous", None)
+    if created or previous is None:
+        return
+    if isinstance(instance, Group) and previous.slug != instance.slug:
+        changes.record_many(
+            Event.objects.filter(group=instance).select_related("group")
+        )
+        changes.record_many(
+            Membership.objects.filter(group=instance).select_related("group", "user")
+        )
+    if isinstance(instance, Event) and previous.slug != instance.slug:
+        changes.record_many(
+            Attendance.objects.filter(event=instance).select_related("event", "user")
+        )
+    if isinstance(instance, CustomUser) and previous.username != instance.username:
+        changes.record_many(
+            Membership.objects.filter(user=instance).select_related("group", "user")
+        )
+        changes.record_many(
+            Attendance.objects.filter(user=instance).select_related("event", "user")
+        )
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_own_groups(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: cache.invalidate_own_groups([user_id]))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_organizers_own_groups(sender, instance, created, **kwargs):
+    if created:
+        return
+    organizers = list(
+        Membership.objects.filter(
+            group=instance, role=Membership.ORGANIZER
+        ).values_list("user_id", flat=True)
+    )
+    transaction.on_commit(lambda: cache.invalidate_own_groups(organizers))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=Comment)
+def update_search(sender, instance, **kwargs):
+    search.update(instance)
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_save, sender=Event)
+def locate(sender, instance, **kwargs):
+    geo.locate(instance)
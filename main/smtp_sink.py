@@ -0,0 +1,65 @@
+import socketserver
+import threading
+import time
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP to accept and discard messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.count("connections")
+        time.sleep(self.server.connect_delay)
+        self.reply("220 localhost ESMTP sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.strip().split(b" ", 1)[0].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 localhost")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(self.server.message_delay)
+                self.server.count("messages")
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                break
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """An SMTP server on localhost that counts what it receives.
+
+    `connect_delay` and `message_delay`, in seconds, stand in for the TLS
+    handshake and round trips of a real provider.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0, connect_delay=0, message_delay=0):
+        super().__init__(("127.0.0.1", port), SMTPHandler)
+        self.port = self.server_address[1]
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.counts = {"connections": 0, "messages": 0}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -1,7 +1,37 @@
+import uuid
+
 from background_task import background
 from django.core.mail import send_mail
+from django.utils import timezone
+
+from main import digest, outbox, reminders
+from main.models import CustomUser
 
 
 @background(schedule=1)
 def email_async(subject, body, from_email, receiver_emails):
     send_mail(subject, body, from_email, receiver_emails)
+
+
+@background(schedule=1)
+def announce(group_id, subject, body, key=None, skip_digest=False):
+    """Queue the same message for every member of a group.
+
+    `key` names the announcement; each member is queued its message once,
+    even if this task runs again. With `skip_digest`, members who get the
+    weekly digest are left out.
+    """
+    members = CustomUser.objects.filter(membership__group=group_id)
+    if skip_digest:
+        members = members.exclude(weekly_digest=True)
+    outbox.enqueue_to(members, key or uuid.uuid4().hex, subject, body)
+
+
+@background(schedule=1, remove_existing_tasks=True)
+def weekly_digest():
+    digest.queue(timezone.now().date())
+
+
+@background(schedule=1, remove_existing_tasks=True)
+def send_reminders():
+    reminders.queue(timezone.now())
@@ -0,0 +1,13 @@
+from django import template
+
+from main import roles
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_organizer(context, group):
+    request = context.get("request")
+    if request is None or not group:
+        return False
+    return roles.is_organizer(request, group)
@@ -0,0 +1,1068 @@
+import datetime
+import re
+import threading
+from unittest import mock, skipUnless
+
+from django import test
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from api import cache as api_cache
+from main import (
+    cache as main_cache,
+    counters,
+    digest,
+    geo,
+    ical,
+    metrics,
+    outbox,
+    reminders,
+)
+from main.middleware import PageCacheMiddleware
+from main.models import (
+    Attendance,
+    City,
+    Comment,
+    CustomUser,
+    EmailRate,
+    Event,
+    Group,
+    Membership,
+    Metric,
+    OutboundEmail,
+)
+
+
+class TestCase(test.TestCase):
+    """Starts every test with an empty cache, as it starts with empty tables."""
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+
+
+class TransactionTestCase(test.TransactionTestCase):
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+
+
+def create_group(slug="group"):
+    return Group.objects.create(name=slug.title(), slug=slug, city=City.named("London"))
+
+
+def create_event(group, slug="event", days=1):
+    return Event.objects.create(
+        group=group,
+        title=slug.title(),
+        slug=slug,
+        date=timezone.now().date() + datetime.timedelta(days=days),
+        time=datetime.time(18, 30),
+    )
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user", "user@example.com", "pw")
+        self.group = create_group()
+        self.event = create_event(self.group)
+
+    def test_rsvp_twice_counts_once(self):
+        self.client.force_login(self.user)
+        path = reverse("main:attendance", args=[self.group.slug, self.event.slug])
+        self.client.post(path)
+        self.client.post(path)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendees_count, 1)
+
+    def test_unrsvp_twice_uncounts_once(self):
+        Attendance.objects.create(event=self.event, user=self.user)
+        first = Attendance.objects.get(event=self.event, user=self.user)
+        second = Attendance.objects.get(event=self.event, user=self.user)
+        first.delete()
+        second.delete()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendees_count, 0)
+
+    def test_leave_twice_uncounts_once(self):
+        Membership.objects.create(group=self.group, user=self.user)
+        first = Membership.objects.get(group=self.group, user=self.user)
+        second = Membership.objects.get(group=self.group, user=self.user)
+        first.delete()
+        second.delete()
+        self.group.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.group.members_count, 0)
+        self.assertEqual(self.user.member_of_count, 0)
+
+    def test_unrsvp_without_rsvp(self):
+        self.client.force_login(self.user)
+        path = reverse(
+            "main:delete_attendance", args=[self.group.slug, self.event.slug]
+        )
+        response = self.client.post(path)
+        self.assertEqual(response.status_code, 302)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendees_count, 0)
+
+    def test_reconcile(self):
+        Attendance.objects.create(event=self.event, user=self.user)
+        Event.objects.filter(pk=self.event.pk).update(attendees_count=7)
+        fixed = counters.reconcile()
+        self.assertEqual(fixed["Event.attendees_count"], 1)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.attendees_count, 1)
+
+
+class CityFormTests(TestCase):
+    def setUp(self):
+        self.client.force_login(
+            CustomUser.objects.create_user("user", "user@example.com", "pw")
+        )
+
+    def post(self, **data):
+        fields = {"name": "Book club", "description": "", "city": "Paris, France"}
+        fields.update(data)
+        return self.client.post(reverse("main:new_group"), fields)
+
+    def test_invalid_form_creates_no_city(self):
+        self.post(latitude="100")
+        self.assertFalse(City.objects.exists())
+
+    def test_invalid_name_creates_no_city(self):
+        self.post(name="ab")
+        self.assertFalse(City.objects.exists())
+
+    def test_new_city_is_created_with_group(self):
+        self.post()
+        group = Group.objects.get(slug="book-club")
+        self.assertEqual((group.city.name, group.city.key), ("Paris", "paris"))
+
+    def test_known_city_is_reused(self):
+        city = City.named("Paris")
+        self.post(city="  paris ")
+        self.assertEqual(Group.objects.get(slug="book-club").city, city)
+        self.assertEqual(City.objects.count(), 1)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentRSVPTests(TransactionTestCase):
+    """RSVPs and un-RSVPs racing each other, as double clicks do."""
+
+    users = 8
+    repeats = 3
+
+    def setUp(self):
+        self.group = create_group()
+        self.event = create_event(self.group)
+        self.members = [
+            CustomUser.objects.create_user("user%d" % i, "user%d@example.com" % i)
+            for i in range(self.users)
+        ]
+
+    def hammer(self, name):
+        """POST to the `name` view for every user, `repeats` times at once."""
+        path = reverse(name, args=[self.group.slug, self.event.slug])
+        barrier = threading.Barrier(self.users * self.repeats)
+        errors = []
+
+        def post(user):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            try:
+                response = client.post(path)
+                if response.status_code != 302:
+                    errors.append(response.status_code)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=post, args=(user,))
+            for user in self.members
+            for i in range(self.repeats)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_counts_stay_exact(self):
+        self.hammer("main:attendance")
+        self.event.refresh_from_db()
+        self.assertEqual(
+            Attendance.objects.filter(event=self.event).count(), self.users
+        )
+        self.assertEqual(self.event.attendees_count, self.users)
+
+        self.hammer("main:delete_attendance")
+        self.event.refresh_from_db()
+        self.assertEqual(Attendance.objects.filter(event=self.event).count(), 0)
+        self.assertEqual(self.event.attendees_count, 0)
+
+
+class RoleQueryTests(TestCase):
+    """Organizer-only views look the user's membership up once."""
+
+    def setUp(self):
+        self.organizer = CustomUser.objects.create_user("organizer", "o@example.com")
+        self.member = CustomUser.objects.create_user("member", "m@example.com")
+        self.group = create_group()
+        self.event = create_event(self.group)
+        Membership.objects.create(
+            group=self.group, user=self.organizer, role=Membership.ORGANIZER
+        )
+        Membership.objects.create(group=self.group, user=self.member)
+
+    def assertQueries(self, method, path, status, count):
+        with self.assertNumQueries(count) as queries:
+            response = getattr(self.client, method)(path)
+        self.assertEqual(response.status_code, status)
+        lookups = [
+            query["sql"]
+            for query in queries.captured_queries
+            if '"main_membership"."user_id" =' in query["sql"]
+        ]
+        self.assertEqual(len(lookups), 1, lookups)
+
+    def pages(self):
+        """(path, queries for an organizer, queries for a member)"""
+        group, event = self.group.slug, self.event.slug
+        return [
+            (reverse("main:new_event", args=[group]), 4, 4),
+            (reverse("main:edit_group", args=[group]), 5, 4),
+            (reverse("main:edit_event", args=[group, event]), 6, 5),
+            (reverse("main:group_organizer", args=[group]), 4, 4),
+            (reverse("main:group_announcement", args=[group]), 4, 4),
+        ]
+
+    def test_organizer_pages(self):
+        self.client.force_login(self.organizer)
+        for path, count, refused in self.pages():
+            self.client.get(path)  # fills the header's cached groups
+            with self.subTest(path=path):
+                self.assertQueries("get", path, 200, count)
+
+    def test_member_is_refused(self):
+        self.client.force_login(self.member)
+        for path, count, refused in self.pages():
+            with self.subTest(path=path):
+                self.assertQueries("get", path, 403, refused)
+
+    def test_leave(self):
+        self.client.force_login(self.member)
+        path = reverse("main:delete_membership", args=[self.group.slug])
+        self.assertQueries("post", path, 302, 12)
+        self.assertFalse(
+            Membership.objects.filter(group=self.group, user=self.member).exists()
+        )
+
+    def test_sole_organizer_cannot_leave(self):
+        self.client.force_login(self.organizer)
+        path = reverse("main:delete_membership", args=[self.group.slug])
+        self.assertQueries("post", path, 403, 4)
+
+
+class IndexTests(TestCase):
+    """The hot queries are answered from the indexes made for them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.now().date()
+        cities = [City.named("City %d" % i) for i in range(5)]
+        CustomUser.objects.bulk_create(
+            CustomUser(username="user%d" % i, email="user%d@example.com" % i)
+            for i in range(50)
+        )
+        users = list(CustomUser.objects.order_by("id"))
+        Group.objects.bulk_create(
+            Group(name="Group %d" % i, slug="group-%d" % i, city=cities[i % 5])
+            for i in range(50)
+        )
+        groups = list(Group.objects.order_by("id"))
+        Event.objects.bulk_create(
+            Event(
+                group=group,
+                title="Event %d" % i,
+                slug="%s-event-%d" % (group.slug, i),
+                date=today + datetime.timedelta(days=i - 10),
+                time=datetime.time(18, 30),
+            )
+            for group in groups
+            for i in range(20)
+        )
+        Membership.objects.bulk_create(
+            Membership(
+                group=group,
+                user=user,
+                role=Membership.ORGANIZER if i == 0 else Membership.MEMBER,
+            )
+            for group in groups
+            for i, user in enumerate(users[:10])
+        )
+        events = list(Event.objects.order_by("id")[:100])
+        Attendance.objects.bulk_create(
+            Attendance(event=event, user=user) for event in events for user in users[:5]
+        )
+        cls.group, cls.user, cls.event = groups[0], users[0], events[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        # With the seeded rows, a sequential scan may well be cheaper than
+        # any index; what is checked is that a matching index exists.
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUses(self, queryset, *indexes):
+        plan = queryset.explain()
+        for index in indexes:
+            self.assertIn(index, plan)
+
+    def test_upcoming_events(self):
+        today = timezone.now().date()
+        events = Event.objects.filter(date__gte=today).order_by("date", "time", "id")
+        self.assertUses(events, "main_event_date_a592cb_idx")
+
+    def test_group_events(self):
+        events = Event.objects.filter(group=self.group, date__gte=timezone.now().date())
+        self.assertUses(
+            events.order_by("date", "time", "id"), "main_event_group_i_7358be_idx"
+        )
+
+    def test_city_groups(self):
+        groups = Group.objects.filter(city=self.group.city_id).order_by("name", "id")
+        self.assertUses(groups, "main_group_city_id_76e231_idx")
+
+    def test_city_events(self):
+        events = Event.objects.filter(
+            group__city=self.group.city_id, date__gte=timezone.now().date()
+        )
+        self.assertUses(events, "main_event_group_i_7358be_idx")
+
+    def test_user_memberships(self):
+        memberships = Membership.objects.filter(
+            user=self.user, role=Membership.ORGANIZER
+        )
+        self.assertUses(memberships, "main_member_user_id_c5d297_idx")
+
+    def test_group_organizers(self):
+        organizers = Membership.objects.filter(
+            group=self.group, role=Membership.ORGANIZER
+        )
+        self.assertUses(organizers, "main_membership_organizer_idx")
+
+    def test_user_attendance(self):
+        attendance = Attendance.objects.filter(user=self.user, event=self.event)
+        if connection.vendor == "sqlite":
+            # SQLite names the index of a UNIQUE table constraint itself.
+            self.assertUses(attendance, "sqlite_autoindex_main_attendance")
+        else:
+            self.assertUses(attendance, "main_attendance_user_event_uniq")
+
+    def test_event_comments(self):
+        comments = Comment.objects.filter(event=self.event).order_by(
+            "date_posted", "id"
+        )
+        self.assertUses(comments, "main_commen_event_i_ba6b82_idx")
+
+
+class RateLimitTests(TestCase):
+    def test_messages_are_spaced(self):
+        limit = outbox.RateLimit(10)
+        with mock.patch("main.outbox.time.sleep") as sleep:
+            for i in range(3):
+                limit.wait()
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 0.1, delta=0.05)
+        self.assertAlmostEqual(delays[1], 0.2, delta=0.05)
+        self.assertEqual(EmailRate.objects.count(), 1)
+
+    def test_idle_time_is_not_saved_up(self):
+        EmailRate.objects.create(
+            host=settings.EMAIL_HOST,
+            next_send=timezone.now() - datetime.timedelta(hours=1),
+        )
+        limit = outbox.RateLimit(10)
+        with mock.patch("main.outbox.time.sleep") as sleep:
+            limit.wait()
+            limit.wait()
+        self.assertEqual(sleep.call_count, 1)
+
+
+class MetricTests(TestCase):
+    def test_counts_add_up(self):
+        metrics.count("sent", 3)
+        metrics.count("sent", 2)
+        metrics.observe("smtp_latency", [0.001, 0.002, 60])
+        stats = metrics.stats()
+        self.assertEqual(stats["sent"], 5)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["smtp_latency"][0], 2)
+        self.assertEqual(stats["smtp_latency"][-1], 1)
+
+    def test_api_cache_hits(self):
+        path = reverse("api:groups")
+        self.client.get(path)
+        self.client.get(path)
+        self.client.get(path)
+        self.assertEqual(api_cache.stats()["groups"], {"hits": 2, "misses": 1})
+        self.assertFalse(Metric.objects.exists())
+
+
+class RenameTests(TransactionTestCase):
+    """Renaming a user or a city evicts every cached response showing it."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com")
+        self.group = create_group()
+        self.event = create_event(self.group)
+        Event.objects.filter(pk=self.event.pk).update(venue="The Crown")
+        Membership.objects.create(
+            group=self.group, user=self.user, role=Membership.ORGANIZER
+        )
+        Attendance.objects.create(event=self.event, user=self.user)
+
+    def paths(self):
+        group, event = self.group.slug, self.event.slug
+        return [
+            reverse("main:group", args=[group]),
+            reverse("main:event", args=[group, event]),
+            reverse("api:single_group", args=[group]),
+            reverse("api:single_event", args=[event]),
+            reverse("api:groups") + "?include=members",
+            reverse("api:events") + "?include=attendees",
+        ]
+
+    def assertRenamed(self, rename, before, after):
+        for path in self.paths():
+            self.client.get(path)
+            self.assertEqual(self.client.get(path)["X-Cache"], "HIT", path)
+        rename()
+        for path in self.paths():
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response["X-Cache"], "MISS")
+                self.assertNotContains(response, before)
+                self.assertContains(response, after)
+
+    def test_user_rename(self):
+        def rename():
+            self.user.username = "bob"
+            self.user.save()
+
+        self.assertRenamed(rename, "alice", "bob")
+        response = self.client.get(reverse("api:single_group", args=["group"]))
+        self.assertEqual(response.json()["members"]["results"], ["bob"])
+
+    def test_city_rename(self):
+        def rename():
+            city = self.group.city
+            city.name = "Londinium"
+            city.save()
+
+        self.assertRenamed(rename, "London", "Londinium")
+
+    def test_login_keeps_cache(self):
+        path = reverse("main:group", args=[self.group.slug])
+        self.client.get(path)
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(self.client.get(path)["X-Cache"], "HIT")
+
+
+class ConditionalTests(TransactionTestCase):
+    """ETags come from the cached tag versions, not from the rows."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com")
+        self.group = create_group()
+        self.event = create_event(self.group)
+        Membership.objects.create(
+            group=self.group, user=self.user, role=Membership.ORGANIZER
+        )
+        Attendance.objects.create(event=self.event, user=self.user)
+
+    def paths(self):
+        return [
+            reverse("main:group", args=[self.group.slug]),
+            reverse("main:event", args=[self.group.slug, self.event.slug]),
+            reverse("api:groups"),
+            reverse("api:groups") + "?city=london",
+            reverse("api:events"),
+            reverse("api:events") + "?city=london",
+            reverse("api:single_group", args=[self.group.slug]),
+            reverse("api:single_event", args=[self.event.slug]),
+        ]
+
+    def etags(self):
+        return {path: self.client.get(path)["ETag"] for path in self.paths()}
+
+    def test_not_modified_without_queries(self):
+        for path, etag in self.etags().items():
+            with self.subTest(path=path), self.assertNumQueries(0):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_rename_changes_etags(self):
+        etags = self.etags()
+        self.user.username = "bob"
+        self.user.save()
+        for path, etag in etags.items():
+            with self.subTest(path=path):
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+
+class OwnGroupsTests(TestCase):
+    """The "my groups" header is looked up once, then served from the cache."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("organizer", "o@example.com")
+        self.group = create_group()
+        Membership.objects.create(
+            group=self.group, user=self.user, role=Membership.ORGANIZER
+        )
+        self.client.force_login(self.user)
+
+    def test_cached_after_first_page(self):
+        path = reverse("main:about")
+        with self.assertNumQueries(3):  # session, user, own groups
+            response = self.client.get(path)
+        self.assertContains(response, "my groups")
+        with self.assertNumQueries(2):
+            response = self.client.get(path)
+        self.assertContains(response, self.group.name)
+
+    def test_pages_without_header_skip_lookup(self):
+        path = reverse("main:group_organizer", args=[self.group.slug])
+        with mock.patch("main.cache.own_groups") as own_groups:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        own_groups.assert_not_called()
+
+
+class PageCacheTests(TransactionTestCase):
+    """Anonymous pages are served from the cache until one of their tags changes."""
+
+    def setUp(self):
+        self.renders = 0
+
+    def get(self, respond=None):
+        """GET a page tagged "page" through PageCacheMiddleware."""
+
+        def view(request):
+            self.renders += 1
+            response = HttpResponse("render %d" % self.renders)
+            if respond is not None:
+                respond(request, response)
+            return response
+
+        view.page_tags = lambda request: ["page"]
+        middleware = PageCacheMiddleware(
+            lambda request: middleware.process_view(request, view, (), {})
+            or view(request)
+        )
+        request = RequestFactory().get("/page/")
+        request.user = AnonymousUser()
+        return middleware(request)
+
+    def test_change_evicts_tagged_page(self):
+        group = create_group()
+        paths = [reverse("main:group", args=[slug]) for slug in ["group", "other"]]
+        create_group("other")
+        for path in paths:
+            self.client.get(path)
+            self.assertEqual(self.client.get(path)["X-Cache"], "HIT")
+        group.name = "Renamed"
+        group.save()
+        response = self.client.get(paths[0])
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "Renamed")
+        self.assertEqual(self.client.get(paths[1])["X-Cache"], "HIT")
+
+    def test_visitor_state_is_not_stored(self):
+        def set_cookie(request, response):
+            response.set_cookie("seen", "1")
+
+        def use_csrf(request, response):
+            get_token(request)
+
+        for respond in [set_cookie, use_csrf]:
+            with self.subTest(respond=respond.__name__):
+                self.assertEqual(self.get(respond)["X-Cache"], "MISS")
+                self.assertEqual(self.get(respond)["X-Cache"], "MISS")
+        response = self.get()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(self.get().content, response.content)
+        self.assertEqual(self.get()["X-Cache"], "HIT")
+
+    def test_one_request_renders_stale_page(self):
+        self.get()
+        main_cache.invalidate_tags(["page"])
+        during = []
+
+        def revalidate(request, response):
+            # Requests arriving while this one holds the lock, in place of
+            # other workers.
+            during.extend(self.get() for i in range(3))
+
+        response = self.get(revalidate)
+        self.assertEqual((response["X-Cache"], response.content), ("MISS", b"render 2"))
+        self.assertEqual(
+            [(stale["X-Cache"], stale.content) for stale in during],
+            [("STALE", b"render 1")] * 3,
+        )
+        self.assertEqual(self.renders, 2)
+        response = self.get()
+        self.assertEqual((response["X-Cache"], response.content), ("HIT", b"render 2"))
+
+
+class ReminderTests(TestCase):
+    now = datetime.datetime(2030, 1, 1, 12, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user", "user@example.com")
+        self.group = create_group()
+
+    def event(self, slug, hours):
+        """An event `hours` from `now`, in TIME_ZONE, that the user attends."""
+        start = timezone.localtime(self.now) + datetime.timedelta(hours=hours)
+        event = Event.objects.create(
+            group=self.group,
+            title=slug.title(),
+            slug=slug,
+            date=start.date(),
+            time=start.time(),
+        )
+        Attendance.objects.create(event=event, user=self.user)
+        return event
+
+    def due(self):
+        return set(reminders.due(self.now).values_list("slug", flat=True))
+
+    def test_due_window(self):
+        self.event("past", -1)
+        self.event("soon", 1)
+        self.event("last", settings.REMINDER_HOURS)
+        self.event("later", settings.REMINDER_HOURS + 1)
+        self.assertEqual(self.due(), {"soon", "last"})
+
+    @override_settings(TIME_ZONE="America/New_York")
+    def test_event_times_are_local(self):
+        self.event("local", settings.REMINDER_HOURS - 1)
+        self.event("later", settings.REMINDER_HOURS + 2)
+        self.assertEqual(self.due(), {"local"})
+
+    def test_sent_once(self):
+        self.event("soon", 1)
+        self.assertEqual(reminders.queue(self.now), 1)
+        self.assertEqual(reminders.queue(self.now), 0)
+        # As after a crash between queueing and setting reminder_sent.
+        Event.objects.update(reminder_sent=False)
+        self.assertEqual(reminders.queue(self.now), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_reschedule_rearms_reminder(self):
+        event = self.event("soon", 1)
+        reminders.queue(self.now)
+        Membership.objects.create(
+            group=self.group, user=self.user, role=Membership.ORGANIZER
+        )
+        self.client.force_login(self.user)
+        path = reverse("main:edit_event", args=[self.group.slug, event.slug])
+        data = {"title": event.title, "slug": event.slug, "date": event.date}
+        self.client.post(path, dict(data, time=event.time, title="Renamed"))
+        self.assertEqual(self.due(), set())
+        self.client.post(path, dict(data, time=datetime.time(event.time.hour + 1)))
+        self.assertEqual(self.due(), {"soon"})
+        self.assertEqual(reminders.queue(self.now), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+
+class CitiesTests(TransactionTestCase):
+    """The list of cities is cached until a city's groups or event dates change."""
+
+    def setUp(self):
+        self.group = create_group()
+        self.event = create_event(self.group)
+        self.user = CustomUser.objects.create_user("user", "user@example.com")
+
+    def assertCities(self, queries, cities):
+        with self.assertNumQueries(queries):
+            listed = main_cache.cities()
+        self.assertEqual(
+            [(city["name"], city["upcoming_count"]) for city in listed], cities
+        )
+
+    def test_event_details_keep_cache(self):
+        self.assertCities(1, [("London", 1)])
+        self.event.title = "Renamed"
+        self.event.save()
+        Attendance.objects.create(event=self.event, user=self.user)
+        Comment.objects.create(event=self.event, author=self.user, body="Hi")
+        self.assertCities(0, [("London", 1)])
+
+    def test_event_dates_evict_cache(self):
+        self.assertCities(1, [("London", 1)])
+        other = create_event(self.group, "other")
+        self.assertCities(1, [("London", 2)])
+        other.date -= datetime.timedelta(days=2)
+        other.save()
+        self.assertCities(1, [("London", 1)])
+        self.event.delete()
+        self.assertCities(1, [("London", 0)])
+
+    def test_groups_and_cities_evict_cache(self):
+        self.assertCities(1, [("London", 1)])
+        Group.objects.create(name="Other", slug="other", city=City.named("Paris"))
+        self.assertCities(1, [("London", 1), ("Paris", 0)])
+        city = self.group.city
+        city.name = "Londinium"
+        city.save()
+        self.assertCities(1, [("Londinium", 1), ("Paris", 0)])
+
+
+@mock.patch("opencult.settings.GROUP_PAGE_SIZE", 2)
+class GroupPageTests(TestCase):
+    """The group page lists events and members a page at a time."""
+
+    lists = {
+        "upcoming": "upcoming_events_list",
+        "past": "past_events_list",
+        "members": "members_list",
+    }
+
+    def setUp(self):
+        self.group = create_group()
+        for i, days in enumerate([1, 2, 2, 3, 4]):
+            create_event(self.group, "upcoming-%d" % i, days)
+        for days in [-1, -2, -3]:
+            create_event(self.group, "past%d" % days, days)
+        for username in ["cat", "ann", "bob"]:
+            user = CustomUser.objects.create_user(username, username + "@example.com")
+            Membership.objects.create(group=self.group, user=user)
+        # Logged in, so pages are rendered rather than served from the cache.
+        visitor = CustomUser.objects.create_user("visitor", "visitor@example.com")
+        self.client.force_login(visitor)
+        self.path = reverse("main:group", args=[self.group.slug])
+
+    def page(self, section, cursor=""):
+        """Titles or usernames listed, and the next and previous cursors."""
+        context = self.client.get(self.path, {section: cursor}).context
+        names = [str(row) for row in context[self.lists[section]]]
+        return names, context[section + "_next"], context[section + "_prev"]
+
+    def walk(self, section):
+        """Every page of a section, following its next links from the first."""
+        pages, cursor = [], ""
+        while cursor is not None:
+            names, cursor, prev = self.page(section, cursor)
+            pages.append(names)
+        return pages
+
+    def test_upcoming_soonest_first(self):
+        self.assertEqual(
+            self.walk("upcoming"),
+            [
+                ["Upcoming-0", "Upcoming-1"],
+                ["Upcoming-2", "Upcoming-3"],
+                ["Upcoming-4"],
+            ],
+        )
+
+    def test_past_latest_first(self):
+        self.assertEqual(self.walk("past"), [["Past-1", "Past-2"], ["Past-3"]])
+
+    def test_members_by_username(self):
+        self.assertEqual(self.walk("members"), [["ann", "bob"], ["cat"]])
+
+    def test_previous_pages(self):
+        names, cursor, prev = self.page("upcoming")
+        self.assertIsNone(prev)
+        names, cursor, prev = self.page("upcoming", cursor)
+        names, cursor, prev = self.page("upcoming", cursor)
+        self.assertEqual(names, ["Upcoming-4"])
+        names, cursor, prev = self.page("upcoming", prev)
+        self.assertEqual(names, ["Upcoming-2", "Upcoming-3"])
+        names, cursor, prev = self.page("upcoming", prev)
+        self.assertEqual((names, prev), (["Upcoming-0", "Upcoming-1"], None))
+
+    def test_sections_are_listed_on_demand(self):
+        response = self.client.get(self.path)
+        self.assertIsNone(response.context["past_events_list"])
+        self.assertIsNone(response.context["members_list"])
+
+    def test_invalid_cursor(self):
+        for section in ["upcoming", "past", "members"]:
+            with self.subTest(section=section):
+                response = self.client.get(self.path, {section: "bm90IGpzb24"})
+                self.assertEqual(response.status_code, 400)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user", "user@example.com")
+        django = create_group("django")
+        knitting = create_group("knitting")
+        yarn = create_event(knitting, "yarn")
+        yarn.details = "No django here, just yarn."
+        yarn.save()
+        sprint = create_event(django, "sprint")
+        Comment.objects.create(event=sprint, author=self.user, body="Django 2.2?")
+        Comment.objects.create(event=yarn, author=self.user, body="See you there")
+
+    def search(self, q):
+        context = self.client.get(reverse("main:search"), {"q": q}).context
+        fields = {"groups": "name", "events": "title", "comments": "body"}
+        return {
+            kind: [getattr(row, field) for row in context[kind + "_list"]]
+            for kind, field in fields.items()
+        }
+
+    def test_matches(self):
+        self.assertEqual(
+            self.search("django"),
+            {"groups": ["Django"], "events": ["Yarn"], "comments": ["Django 2.2?"]},
+        )
+
+    def test_no_matches(self):
+        empty = {"groups": [], "events": [], "comments": []}
+        self.assertEqual(self.search("cobol"), empty)
+        self.assertEqual(self.search(" "), empty)
+
+    @skipUnless(connection.vendor == "postgresql", "ranks need full text search")
+    def test_titles_rank_first(self):
+        create_event(Group.objects.get(slug="knitting"), "django-night")
+        self.assertEqual(self.search("django")["events"], ["Django-Night", "Yarn"])
+
+
+class CalendarTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user", "user@example.com")
+        self.group = create_group()
+        self.event = create_event(self.group, "meetup")
+        self.event.title = "Talks, drinks; more"
+        self.event.save()
+        create_event(self.group, "last-week", -7)
+        create_event(self.group, "last-year", -365)
+
+    def feed(self, path, **headers):
+        response = self.client.get(path, **headers)
+        if response.status_code == 200:
+            self.assertEqual(response["Content-Type"], ical.CONTENT_TYPE)
+        return response
+
+    def uids(self, response):
+        lines = response.content.decode().split("\r\n")
+        return sorted(line for line in lines if line.startswith("UID:"))
+
+    def uid(self, event):
+        return "UID:event-%d@testserver" % event.id
+
+    def test_group_feed(self):
+        response = self.feed(reverse("main:group_calendar", args=[self.group.slug]))
+        self.assertEqual(
+            self.uids(response),
+            sorted(
+                self.uid(event) for event in Event.objects.exclude(slug="last-year")
+            ),
+        )
+        self.assertContains(response, "SUMMARY:Talks\\, drinks\\; more (Group)")
+        self.assertIn("public", response["Cache-Control"])
+        missing = reverse("main:group_calendar", args=["missing"])
+        self.assertEqual(self.feed(missing).status_code, 404)
+
+    def test_group_feed_is_revalidated(self):
+        path = reverse("main:group_calendar", args=[self.group.slug])
+        etag = self.feed(path)["ETag"]
+        self.assertEqual(self.feed(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        event = create_event(self.group, "next-week", 7)
+        response = self.feed(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.uid(event), self.uids(response))
+
+    def test_user_feed(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse("main:calendar_token"))
+        self.user.refresh_from_db()
+        path = reverse("main:calendar", args=[self.user.calendar_token])
+        self.assertEqual(self.uids(self.feed(path)), [])
+
+        Attendance.objects.create(event=self.event, user=self.user)
+        response = self.feed(path)
+        self.assertEqual(self.uids(response), [self.uid(self.event)])
+        self.assertIn("private", response["Cache-Control"])
+        etag = response["ETag"]
+        self.assertEqual(self.feed(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Attendance.objects.all().delete()
+        response = self.feed(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(self.uids(response), [])
+
+    def test_new_token_revokes_previous(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse("main:calendar_token"))
+        self.user.refresh_from_db()
+        previous = reverse("main:calendar", args=[self.user.calendar_token])
+        self.assertEqual(self.feed(previous).status_code, 200)
+        self.client.post(reverse("main:calendar_token"))
+        self.assertEqual(self.feed(previous).status_code, 404)
+        self.user.refresh_from_db()
+        path = reverse("main:calendar", args=[self.user.calendar_token])
+        self.assertEqual(self.feed(path).status_code, 200)
+
+    def test_long_lines_are_folded(self):
+        line = "DESCRIPTION:" + "é" * 100
+        folded = ical.fold(line).split("\r\n")
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded))
+        self.assertEqual(folded[0] + "".join(part[1:] for part in folded[1:]), line)
+
+
+class NearbyTests(TestCase):
+    """Events near a point, around Trafalgar Square unless said otherwise."""
+
+    latitude, longitude = 51.508, -0.128
+
+    def setUp(self):
+        self.group = create_group()
+
+    def event(self, slug, days=1, **location):
+        event = create_event(self.group, slug, days)
+        for field, value in location.items():
+            setattr(event, field, value)
+        event.save()
+        return event
+
+    def nearby(self, radius_km, limit=None, latitude=None, longitude=None):
+        rows = geo.nearby(
+            Event.objects.all(),
+            self.latitude if latitude is None else latitude,
+            self.longitude if longitude is None else longitude,
+            radius_km,
+            limit=limit,
+        )
+        return [(row.slug, round(row.distance_km)) for row in rows]
+
+    def test_maps_links(self):
+        self.event("soho", maps_url="https://www.google.com/maps/@51.5136,-0.1365,17z")
+        self.event(
+            "greenwich",
+            maps_url="https://www.openstreetmap.org/?mlat=51.4826&mlon=-0.0077",
+        )
+        self.event("no-link", maps_url="https://example.com/venue")
+        soho = Event.objects.get(slug="soho")
+        self.assertEqual((soho.latitude, soho.longitude), (51.5136, -0.1365))
+        self.assertEqual(soho.cell, geo.cell(51.5136, -0.1365))
+        self.assertIsNone(Event.objects.get(slug="no-link").cell)
+        self.assertEqual(self.nearby(25), [("soho", 1), ("greenwich", 9)])
+
+    def test_radius_and_limit(self):
+        self.event("soho", latitude=51.5136, longitude=-0.1365)
+        self.event("greenwich", latitude=51.4826, longitude=-0.0077)
+        self.event("oxford", latitude=51.752, longitude=-1.2577)
+        self.assertEqual(self.nearby(5), [("soho", 1)])
+        self.assertEqual(
+            self.nearby(100), [("soho", 1), ("greenwich", 9), ("oxford", 83)]
+        )
+        self.assertEqual(self.nearby(100, limit=2), [("soho", 1), ("greenwich", 9)])
+
+    def test_antimeridian(self):
+        self.event("east", latitude=-16.5, longitude=179.95)
+        self.event("west", latitude=-16.5, longitude=-179.95)
+        self.assertEqual(
+            self.nearby(25, latitude=-16.5, longitude=180), [("east", 5), ("west", 5)]
+        )
+
+    def test_index_lists_upcoming_events(self):
+        self.event("soho", latitude=51.5136, longitude=-0.1365)
+        self.event("last-week", -7, latitude=51.5136, longitude=-0.1365)
+        response = self.client.get(
+            reverse("main:index"), {"lat": self.latitude, "lon": self.longitude}
+        )
+        self.assertEqual(
+            [event.slug for event in response.context["nearby_events_list"]], ["soho"]
+        )
+        self.assertContains(response, "0.9 km away")
+
+
+class DigestTests(TestCase):
+    start = datetime.date(2030, 1, 7)  # a Monday
+
+    def setUp(self):
+        chess, go = create_group("chess"), create_group("go")
+        for group, days, title in [
+            (chess, -1, "Last week"),
+            (chess, 3, "Blitz"),
+            (go, 1, "Opening"),
+            (chess, 0, "Endgames"),
+            (go, 1, "Ladder"),
+            (chess, 7, "Next week"),
+        ]:
+            Event.objects.create(
+                group=group,
+                title=title,
+                slug=title.lower().replace(" ", "-"),
+                date=self.start + datetime.timedelta(days=days),
+                time=datetime.time(20 if title == "Opening" else 18),
+            )
+        for username, email, subscribed, groups in [
+            ("alice", "alice@example.com", True, [chess, go]),
+            ("bob", "bob@example.com", True, [go]),
+            ("carol", "carol@example.com", False, [chess, go]),
+            ("dave", "", True, [chess]),
+            ("erin", "erin@example.com", True, [create_group("idle")]),
+        ]:
+            user = CustomUser.objects.create_user(
+                username, email, weekly_digest=subscribed
+            )
+            for group in groups:
+                Membership.objects.create(group=group, user=user)
+
+    def digests(self):
+        """Titles listed in each queued digest, by recipient."""
+        return {
+            message.to_email: re.findall(r"at \d\d:\d\d: (.+)", message.body)
+            for message in OutboundEmail.objects.filter(key__startswith="digest:")
+        }
+
+    def test_one_digest_per_subscriber(self):
+        self.assertEqual(digest.queue(self.start), 2)
+        self.assertEqual(
+            self.digests(),
+            {
+                "alice@example.com": ["Endgames", "Ladder", "Opening", "Blitz"],
+                "bob@example.com": ["Ladder", "Opening"],
+            },
+        )
+
+    @override_settings(EMAIL_BATCH_SIZE=1)
+    def test_subscribers_span_batches(self):
+        self.assertEqual(digest.queue(self.start), 2)
+        self.assertEqual(len(self.digests()["alice@example.com"]), 4)
+
+    def test_queued_once(self):
+        digest.queue(self.start)
+        digest.queue(self.start)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+    def test_next_run(self):
+        monday = datetime.datetime(2030, 1, 7, tzinfo=datetime.timezone.utc)
+        for now, run in [
+            (monday, monday.replace(hour=8)),
+            (monday.replace(hour=8), monday.replace(day=14, hour=8)),
+            (monday.replace(day=13, hour=23), monday.replace(day=14, hour=8)),
+        ]:
+            with self.subTest(now=now):
+                self.assertEqual(digest.next_run(now), run)
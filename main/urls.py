@@ -56,6 +56,10 @@ urlpatterns = [
     ),
     path("signup/", views.SignUp.as_view(), name="signup"),
     path("about/", views.about, name="about"),
+    path("cities/", views.cities, name="cities"),
+    path("search/", views.search, name="search"),
+    path("calendar/", views.calendar_token, name="calendar_token"),
+    path("calendar/<slug:token>.ics", views.calendar, name="calendar"),
     path("new/", views.new_group, name="new_group"),
     path("@<username>/edit/", views.edit_profile, name="edit_profile"),
     path("@<username>/", views.profile, name="profile"),
@@ -75,6 +79,7 @@ urlpatterns = [
         views.attendance,
         name="attendance",
     ),
+    path("<slug:group_slug>/calendar.ics", views.group_calendar, name="group_calendar"),
     path("<slug:group_slug>/new/", views.new_event, name="new_event"),
     path("<slug:group_slug>/edit/", views.edit_group, name="edit_group"),
     path("<slug:group_slug>/organizer/", views.group_organizer, name="group_organizer"),
@@ -1,7 +1,11 @@
+import datetime
+import uuid
+
 import shortuuid
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, render
@@ -16,27 +20,68 @@ from django.views.decorators.http import (
     require_safe,
 )
 
-from main import forms, models, tasks
+from main import cache, digest, forms, geo, ical, models, roles, tasks
+from main.conditional import (
+    calendar_version,
+    event_version,
+    group_version,
+    versioned_page,
+)
+from main.pagination import keyset
+from main.search import RANK_KEYS, matches
 from opencult import settings
 
 
+def events_window(request, events):
+    """Limit `events` to the window starting at ?from= (default today).
+
+    Returns the events in the window, with their groups, and the date of the
+    first event after it, if any, to link to the next window.
+    """
+    today = timezone.now().date()
+    try:
+        start = datetime.datetime.strptime(request.GET.get("from", ""), "%Y-%m-%d")
+        start = max(start.date(), today)
+    except ValueError:
+        start = today
+    end = start + datetime.timedelta(days=settings.EVENTS_WINDOW_DAYS)
+
+    events_list = (
+        events.filter(date__gte=start, date__lt=end)
+        .select_related("group__city")
+        .order_by("date", "time")
+    )
+    next_date = (
+        events.filter(date__gte=end)
+        .order_by("date")
+        .values_list("date", flat=True)
+        .first()
+    )
+    return events_list, next_date
+
+
 @require_safe
+@cache.cached_page(cache.index_page_tags)
 def index(request):
     if request.GET.get("city"):
         return city(request)
 
     now = timezone.now()
-    events_list = models.Event.objects.filter(date__gte=now.date()).order_by(
-        "date", "time"
+    events_list, next_date = events_window(request, models.Event.objects.all())
+    attending_events_list = (
+        models.Event.objects.filter(
+            attendees__username=request.user.username, date__gte=now.date()
+        )
+        .select_related("group__city")
+        .order_by("date", "time")
     )
-    attending_events_list = models.Event.objects.filter(
-        attendees__username=request.user.username, date__gte=now.date()
-    ).order_by("date", "time")
 
-    own_groups = None
-    if request.user.is_authenticated:
-        own_groups = models.Group.objects.filter(
-            membership__user=request.user, membership__role=models.Membership.ORGANIZER
+    nearby_events_list = None
+    point = geo.requested_point(request)
+    if point:
+        upcoming = models.Event.objects.filter(date__gte=now.date())
+        nearby_events_list = geo.nearby(
+            upcoming.select_related("group__city"), *point, limit=settings.NEARBY_EVENTS
         )
 
     return render(
@@ -45,28 +90,25 @@ def index(request):
         {
             "nav_show_own_groups": True,
             "events_list": events_list,
+            "next_date": next_date,
             "attending_events_list": attending_events_list,
-            "own_groups": own_groups,
+            "nearby_events_list": nearby_events_list,
         },
     )
 
 
 @require_safe
 def city(request):
-    city = request.GET.get("city")
+    key = models.city_key(request.GET.get("city"))
+    city = models.City.objects.filter(key=key).first()
+    if city is None:
+        raise Http404("City not found")
 
-    now = timezone.now()
-    events_list = models.Event.objects.filter(
-        group__city=city, date__gte=now.date()
-    ).order_by("date", "time")
-
-    groups_list = models.Group.objects.filter(city=city)
+    events_list, next_date = events_window(
+        request, models.Event.objects.filter(group__city=city)
+    )
 
-    own_groups = None
-    if request.user.is_authenticated:
-        own_groups = models.Group.objects.filter(
-            membership__user=request.user, membership__role=models.Membership.ORGANIZER
-        )
+    groups_list = models.Group.objects.filter(city=city).order_by("name")
 
     return render(
         request,
@@ -74,13 +116,69 @@ def city(request):
         {
             "nav_show_own_groups": True,
             "events_list": events_list,
+            "next_date": next_date,
             "groups_list": groups_list,
-            "own_groups": own_groups,
             "city": city,
         },
     )
 
 
+@require_safe
+def cities(request):
+    return render(
+        request,
+        "main/cities.html",
+        {"nav_show_own_groups": True, "cities_list": cache.cities()},
+    )
+
+
+@require_safe
+def search(request):
+    q = request.GET.get("q", "").strip()
+    limit = settings.SEARCH_PAGE_SIZE
+    groups = events = comments = ([], None, None)
+    if q:
+        groups = keyset(
+            matches("groups", q).select_related("city"),
+            RANK_KEYS,
+            cursor=request.GET.get("groups"),
+            limit=limit,
+        )
+        events = keyset(
+            matches("events", q).select_related("group"),
+            RANK_KEYS,
+            cursor=request.GET.get("events"),
+            limit=limit,
+        )
+        comments = keyset(
+            matches("comments", q).select_related("author", "event__group"),
+            RANK_KEYS,
+            cursor=request.GET.get("comments"),
+            limit=limit,
+        )
+    groups_list, groups_next, groups_prev = groups
+    events_list, events_next, events_prev = events
+    comments_list, comments_next, comments_prev = comments
+
+    return render(
+        request,
+        "main/search.html",
+        {
+            "nav_show_own_groups": True,
+            "q": q,
+            "groups_list": groups_list,
+            "groups_next": groups_next,
+            "groups_prev": groups_prev,
+            "events_list": events_list,
+            "events_next": events_next,
+            "events_prev": events_prev,
+            "comments_list": comments_list,
+            "comments_next": comments_next,
+            "comments_prev": comments_prev,
+        },
+    )
+
+
 class SignUp(generic.CreateView):
     form_class = forms.CustomUserCreationForm
     success_url = reverse_lazy("main:login")
@@ -88,26 +186,54 @@ class SignUp(generic.CreateView):
 
 
 @require_safe
+@cache.cached_page(cache.group_page_tags)
+@versioned_page(group_version)
 def group(request, group_slug):
     try:
-        group = models.Group.objects.get(slug=group_slug)
+        group = models.Group.objects.select_related("city").get(slug=group_slug)
     except models.Group.DoesNotExist:
         raise Http404("Group not found")
 
-    now = timezone.now()
-    upcoming_events_list = models.Event.objects.filter(
-        group=group, date__gte=now.date()
-    ).order_by("-date", "-time")
-    past_events_list = models.Event.objects.filter(
-        group=group, date__lt=now.date()
-    ).order_by("-date", "-time")
-
-    membership = None  # not authed
+    today = timezone.now().date()
+    limit = settings.GROUP_PAGE_SIZE
+    events = models.Event.objects.filter(group=group)
+
+    # Soonest first, so that the first page shows the next events; latest
+    # first would leave them on the last page.
+    upcoming_events_list, upcoming_next, upcoming_prev = keyset(
+        events.filter(date__gte=today),
+        ["date", "time", "id"],
+        cursor=request.GET.get("upcoming"),
+        limit=limit,
+    )
+    # Past events and members are only listed once their section is opened,
+    # which links here with an empty ?past= or ?members= cursor.
+    past_events_list = past_next = past_prev = None
+    if "past" in request.GET:
+        past_events_list, past_next, past_prev = keyset(
+            events.filter(date__lt=today),
+            ["-date", "-time", "-id"],
+            cursor=request.GET.get("past"),
+            limit=limit,
+        )
+    members_list = members_next = members_prev = None
+    if "members" in request.GET:
+        members_list, members_next, members_prev = keyset(
+            models.CustomUser.objects.filter(membership__group=group).only("username"),
+            ["username", "id"],
+            cursor=request.GET.get("members"),
+            limit=limit,
+        )
+
+    membership = roles.membership(request, group)
+    attending = set()
     if request.user.is_authenticated:
-        try:
-            membership = models.Membership.objects.get(user=request.user, group=group)
-        except models.Membership.DoesNotExist:  # user is not member
-            membership = None
+        listed = upcoming_events_list + (past_events_list or [])
+        attending = set(
+            models.Attendance.objects.filter(
+                user=request.user, event__in=[event.id for event in listed]
+            ).values_list("event_id", flat=True)
+        )
 
     return render(
         request,
@@ -118,21 +244,31 @@ def group(request, group_slug):
             "ld_group": True,
             "group": group,
             "membership": membership,
+            "attending": attending,
             "upcoming_events_list": upcoming_events_list,
+            "upcoming_next": upcoming_next,
+            "upcoming_prev": upcoming_prev,
             "past_events_list": past_events_list,
+            "past_next": past_next,
+            "past_prev": past_prev,
+            "members_list": members_list,
+            "members_next": members_next,
+            "members_prev": members_prev,
         },
     )
 
 
 @require_safe
+@cache.cached_page(cache.event_page_tags)
+@versioned_page(event_version)
 def event(request, group_slug, event_slug):
     try:
-        event = models.Event.objects.get(slug=event_slug)
+        event = models.Event.objects.select_related("group__city").get(
+            slug=event_slug, group__slug=group_slug
+        )
     except models.Event.DoesNotExist:
         raise Http404("Event not found")
 
-    group = models.Group.objects.get(slug=group_slug)
-
     attendance = None  # not authed
     if request.user.is_authenticated:
         try:
@@ -140,6 +276,20 @@ def event(request, group_slug, event_slug):
         except models.Attendance.DoesNotExist:  # user is not attending
             attendance = None
 
+    limit = settings.EVENT_PAGE_SIZE
+    comments_list, comments_next, comments_prev = keyset(
+        models.Comment.objects.filter(event=event).select_related("author"),
+        ["date_posted", "id"],
+        cursor=request.GET.get("comments"),
+        limit=limit,
+    )
+    attendances_list, attendances_next, attendances_prev = keyset(
+        models.Attendance.objects.filter(event=event).select_related("user"),
+        ["date_rsvped", "id"],
+        cursor=request.GET.get("attendees"),
+        limit=limit,
+    )
+
     form = forms.CommentCreationForm()
 
     return render(
@@ -151,38 +301,64 @@ def event(request, group_slug, event_slug):
             "ld_event": True,
             "now": timezone.now(),
             "event": event,
-            "group": group,
+            "group": event.group,
             "attendance": attendance,
+            "comments_list": comments_list,
+            "comments_next": comments_next,
+            "comments_prev": comments_prev,
+            "attendances_list": attendances_list,
+            "attendances_next": attendances_next,
+            "attendances_prev": attendances_prev,
             "form": form,
         },
     )
 
 
 @require_safe
+@cache.cached_page(cache.static_page_tags)
 def about(request):
     return render(request, "main/about.html", {"nav_show_own_groups": True})
 
 
 @require_safe
+@cache.cached_page(cache.profile_page_tags)
 def profile(request, username):
     try:
         user = models.CustomUser.objects.get(username=username)
     except models.CustomUser.DoesNotExist:
         raise Http404("User not found")
 
-    own_groups = None
-    if request.user.is_authenticated:
-        own_groups = models.Group.objects.filter(
-            membership__user=request.user, membership__role=models.Membership.ORGANIZER
-        )
-
     return render(
-        request,
-        "main/profile.html",
-        {"nav_show_own_groups": True, "own_groups": own_groups, "user": user},
+        request, "main/profile.html", {"nav_show_own_groups": True, "user": user}
+    )
+
+
+@require_safe
+def group_calendar(request, group_slug):
+    version = group_version(request, group_slug)
+    return ical.respond(request, version, lambda: ical.group_feed(request, group_slug))
+
+
+@require_safe
+def calendar(request, token):
+    version = calendar_version(request, token)
+    if version is None:
+        raise Http404("Calendar not found")
+    return ical.respond(
+        request, version, lambda: ical.user_feed(request, token), private=True
     )
 
 
+@require_POST
+@login_required
+def calendar_token(request):
+    # A new token also revokes the address of the previous one.
+    request.user.calendar_token = ical.new_token()
+    request.user.save(update_fields=["calendar_token"])
+    messages.success(request, "Calendar address created")
+    return redirect("main:profile", request.user.username)
+
+
 @require_http_methods(["HEAD", "GET", "POST"])
 @login_required
 def edit_profile(request, username):
@@ -194,7 +370,8 @@ def edit_profile(request, username):
 
         form = forms.CustomUserChangeForm(request.POST, instance=request.user)
         if form.is_valid():
-            updated_user = form.save()
+            with transaction.atomic():
+                updated_user = form.save()
             messages.success(request, "Profile updated")
             return redirect("main:profile", updated_user.username)
     else:
@@ -212,7 +389,10 @@ def edit_profile(request, username):
 def new_group(request):
     INVALID_GROUP_NAMES = [
         "api",
+        "calendar",
+        "cities",
         "group",
+        "search",
         "about",
         "signup",
         "logout",
@@ -232,10 +412,11 @@ def new_group(request):
             if len(new_group.slug) < 3 or new_group.slug in INVALID_GROUP_NAMES:
                 messages.error(request, "Group name is invalid. Please choose another.")
                 return redirect("main:new_group")
-            new_group.save()
-            models.Membership.objects.create(
-                group=new_group, user=request.user, role=models.Membership.ORGANIZER
-            )
+            with transaction.atomic():
+                new_group.save()
+                models.Membership.objects.create(
+                    group=new_group, user=request.user, role=models.Membership.ORGANIZER
+                )
             return redirect("main:group", group_slug=new_group.slug)
     else:
         form = forms.GroupCreationForm()
@@ -249,7 +430,7 @@ def new_group(request):
 @login_required
 def new_event(request, group_slug):
     group = models.Group.objects.get(slug=group_slug)
-    if request.user not in group.organizers_list:
+    if not roles.is_organizer(request, group):
         return HttpResponse(status=403)
     if request.method == "POST":
         form = forms.EventCreationForm(request.POST)
@@ -257,40 +438,41 @@ def new_event(request, group_slug):
             new_event = form.save(commit=False)
             new_event.slug = slugify(new_event.title)
             new_event.group = group
-            try:
-                new_event.save()
-            except IntegrityError:
-                uuid = shortuuid.ShortUUID(
-                    "abdcefghkmnpqrstuvwxyzABDCEFGHKMNPQRSTUVWXYZ23456789"
-                ).random(length=12)
-                new_event.slug = slugify(new_event.title) + "-" + uuid
-                new_event.save()
-            models.Attendance.objects.create(event=new_event, user=request.user)
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        new_event.save()
+                except IntegrityError:
+                    short_id = shortuuid.ShortUUID(
+                        "abdcefghkmnpqrstuvwxyzABDCEFGHKMNPQRSTUVWXYZ23456789"
+                    ).random(length=12)
+                    new_event.slug = slugify(new_event.title) + "-" + short_id
+                    new_event.save()
+                models.Attendance.objects.create(event=new_event, user=request.user)
 
             # send email announcement to members
-            for member in group.members.all():
-                data = {
-                    "protocol": request.scheme,
-                    "domain": get_current_site(request).domain,
-                    "member_email": member.email,
-                    "event_title": new_event.title,
-                    "event_date": new_event.date.strftime("%A, %B %-d, %Y"),
-                    "event_time": new_event.time.strftime("%H:%I"),
-                    "event_details": new_event.details,
-                    "event_venue": new_event.venue,
-                    "event_address": new_event.address,
-                    "event_maps_url": new_event.maps_url,
-                    "event_slug": new_event.slug,
-                    "group_name": group.name,
-                    "group_city": group.city,
-                    "group_slug": group.slug,
-                }
-                tasks.email_async(
-                    group.name + " announcement: " + new_event.title + " event",
-                    render_to_string("main/announce_event_email.txt", {"data": data}),
-                    settings.DEFAULT_FROM_EMAIL,
-                    [data["member_email"]],
-                )
+            data = {
+                "protocol": request.scheme,
+                "domain": get_current_site(request).domain,
+                "event_title": new_event.title,
+                "event_date": new_event.date.strftime("%A, %B %-d, %Y"),
+                "event_time": new_event.time.strftime("%H:%I"),
+                "event_details": new_event.details,
+                "event_venue": new_event.venue,
+                "event_address": new_event.address,
+                "event_maps_url": new_event.maps_url,
+                "event_slug": new_event.slug,
+                "group_name": group.name,
+                "group_city": group.city.name,
+                "group_slug": group.slug,
+            }
+            tasks.announce(
+                group.id,
+                group.name + " announcement: " + new_event.title + " event",
+                render_to_string("main/announce_event_email.txt", {"data": data}),
+                "event:%d" % new_event.id,
+                skip_digest=digest.covers(new_event.date),
+            )
 
             return redirect(
                 "main:event", group_slug=group.slug, event_slug=new_event.slug
@@ -313,13 +495,14 @@ def edit_group(request, group_slug):
     except models.Group.DoesNotExist:
         raise Http404("Group not found")
 
-    if request.user not in group.organizers_list:
+    if not roles.is_organizer(request, group):
         return HttpResponse(status=403)
 
     if request.method == "POST":
         form = forms.GroupChangeForm(request.POST, instance=group)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             return redirect("main:group", group_slug=group.slug)
     else:
         form = forms.GroupChangeForm(instance=group)
@@ -337,13 +520,19 @@ def edit_event(request, group_slug, event_slug):
     group = models.Group.objects.get(slug=group_slug)
     event = models.Event.objects.get(slug=event_slug)
 
-    if request.user not in group.organizers_list:
+    if not roles.is_organizer(request, group):
         return HttpResponse(status=403)
 
     if request.method == "POST":
+        # changed_data can't tell: the template has no hidden initial inputs
+        start = (event.date, event.time)
         form = forms.EventChangeForm(request.POST, instance=event)
         if form.is_valid():
-            form.save()
+            # a rescheduled event gets a reminder for its new date
+            if (event.date, event.time) != start:
+                event.reminder_sent = False
+            with transaction.atomic():
+                form.save()
             return redirect("main:event", group_slug=group.slug, event_slug=event.slug)
     else:
         form = forms.EventChangeForm(instance=event)
@@ -358,7 +547,7 @@ def edit_event(request, group_slug, event_slug):
 def membership(request, group_slug):
     group = models.Group.objects.get(slug=group_slug)
     models.Membership.objects.get_or_create(
-        user=request.user, group=group, role=models.Membership.MEMBER
+        user=request.user, group=group, defaults={"role": models.Membership.MEMBER}
     )
     return redirect("main:group", group_slug=group.slug)
 
@@ -367,12 +556,15 @@ def membership(request, group_slug):
 @login_required
 def delete_membership(request, group_slug):
     group = models.Group.objects.get(slug=group_slug)
+    membership = roles.membership(request, group)
+    if membership is None:
+        return redirect("main:group", group_slug=group.slug)
 
     # solo group organizer cannot unjoin
-    if request.user in group.organizers_list and group.organizers_count == 1:
+    if membership.role == models.Membership.ORGANIZER and group.organizers_count == 1:
         return HttpResponse(status=403)
 
-    models.Membership.objects.get(user=request.user, group=group).delete()
+    membership.delete()
     return redirect("main:group", group_slug=group.slug)
 
 
@@ -400,7 +592,7 @@ def delete_attendance(request, group_slug, event_slug):
     if event.date < now.date():
         return HttpResponse(status=403)
 
-    models.Attendance.objects.get(user=request.user, event=event).delete()
+    models.Attendance.objects.filter(user=request.user, event=event).delete()
     return redirect("main:event", group_slug=group_slug, event_slug=event.slug)
 
 
@@ -409,7 +601,7 @@ def delete_attendance(request, group_slug, event_slug):
 def group_organizer(request, group_slug):
     group = models.Group.objects.get(slug=group_slug)
 
-    if request.user not in group.organizers_list:
+    if not roles.is_organizer(request, group):
         return HttpResponse(status=403)
 
     if request.method == "POST":
@@ -421,9 +613,16 @@ def group_organizer(request, group_slug):
             except models.CustomUser.DoesNotExist:
                 messages.error(request, 'User "' + username + '" does not exist.')
                 return redirect("main:group_organizer", group.slug)
-            membership, created = models.Membership.objects.get_or_create(
-                user=user, group=group, role=models.Membership.ORGANIZER
-            )
+            with transaction.atomic():
+                membership, created = models.Membership.objects.get_or_create(
+                    user=user,
+                    group=group,
+                    defaults={"role": models.Membership.ORGANIZER},
+                )
+                if not created and membership.role != models.Membership.ORGANIZER:
+                    membership.role = models.Membership.ORGANIZER
+                    membership.save()
+                    created = True
             if created:
                 messages.success(
                     request,
@@ -458,26 +657,25 @@ def comment(request, group_slug, event_slug):
 def group_announcement(request, group_slug):
     group = models.Group.objects.get(slug=group_slug)
 
-    if request.user not in group.organizers_list:
+    if not roles.is_organizer(request, group):
         return HttpResponse(status=403)
 
     if request.method == "POST":
         form = forms.GroupAnnouncementForm(request.POST)
         if form.is_valid():
             # send email announcement to members
-            for member in group.members.all():
-                tasks.email_async(
-                    "Announcement from " + group.name,
-                    render_to_string(
-                        "main/group_announcement_email.txt",
-                        {
-                            "group_name": group.name,
-                            "message": form.cleaned_data.get("message"),
-                        },
-                    ),
-                    settings.DEFAULT_FROM_EMAIL,
-                    [member.email],
-                )
+            tasks.announce(
+                group.id,
+                "Announcement from " + group.name,
+                render_to_string(
+                    "main/group_announcement_email.txt",
+                    {
+                        "group_name": group.name,
+                        "message": form.cleaned_data.get("message"),
+                    },
+                ),
+                "announcement:" + uuid.uuid4().hex,
+            )
             messages.success(request, "The announcement has been emailed.")
             return redirect("main:group", group_slug=group.slug)
     else:
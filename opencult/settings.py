@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import sys
 
 import dj_database_url
 
@@ -55,6 +56,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "main.middleware.PageCacheMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -71,6 +73,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "main.context_processors.own_groups",
             ]
         },
     }
@@ -95,6 +98,36 @@ db_from_env = dj_database_url.config(conn_max_age=500)
 DATABASES["default"].update(db_from_env)
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The web, worker and mailer containers share one memcached, found at
+# $MEMCACHED_LOCATION, so a save in the worker invalidates the pages the web
+# container cached: a file or local-memory cache would leave them stale.
+# Without it, in development and under tests, the cache is local memory.
+# memcached evicts the least recently used entries when full; losing a tag
+# version only makes the entries cached under it miss.
+
+if os.environ.get("MEMCACHED_LOCATION") and sys.argv[1:2] != ["test"]:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.MemcachedCache",
+            "LOCATION": os.environ["MEMCACHED_LOCATION"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Cached API responses are dropped as soon as the data behind them changes,
+# and in any case after this many seconds.
+
+API_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
@@ -143,6 +176,116 @@ EMAIL_PORT = 587
 
 DEFAULT_FROM_EMAIL = "hi@opencult.com"
 
+# Outbound email is queued and sent by `manage.py send_emails` workers, any
+# number of which may run side by side. Messages are queued and claimed in
+# batches of EMAIL_BATCH_SIZE, and each worker sends them over
+# EMAIL_CONNECTIONS persistent SMTP connections. All workers together send
+# at most EMAIL_RATE_LIMIT messages a second through EMAIL_HOST, spaced
+# evenly; the limit is kept in the database, so it holds across containers.
+
+EMAIL_BATCH_SIZE = 200
+EMAIL_CONNECTIONS = 4
+EMAIL_RATE_LIMIT = 14
+
+# A failed message is sent again after EMAIL_RETRY_DELAY seconds, doubling
+# with every attempt, up to EMAIL_MAX_ATTEMPTS attempts. A worker that has
+# not reported on a claimed message after EMAIL_CLAIM_TIMEOUT seconds is
+# presumed dead and the message is claimed again. Idle workers look for due
+# messages every EMAIL_POLL_INTERVAL seconds.
+
+EMAIL_RETRY_DELAY = 60
+EMAIL_MAX_ATTEMPTS = 6
+EMAIL_CLAIM_TIMEOUT = 600
+EMAIL_POLL_INTERVAL = 5
+
+# Members who opt in get a digest of their groups' events of the next
+# DIGEST_DAYS every week, on DIGEST_WEEKDAY (0 is Monday) at DIGEST_HOUR,
+# instead of an email for each event a digest will list. Links in emails
+# sent outside of a request start with SITE_URL.
+
+DIGEST_WEEKDAY = 0
+DIGEST_HOUR = 8
+DIGEST_DAYS = 7
+
+SITE_URL = os.environ.get("SITE_URL", "https://opencult.com")
+
+# Attendees are reminded of an event REMINDER_HOURS before it starts, by a
+# job that runs every REMINDER_INTERVAL seconds.
+
+REMINDER_HOURS = 24
+REMINDER_INTERVAL = 15 * 60
+
+
+# The index and city pages list this many days of events at a time.
+
+EVENTS_WINDOW_DAYS = 30
+
+# Group pages list upcoming events, past events and members this many at a
+# time. Past events and members are only listed when asked for.
+
+GROUP_PAGE_SIZE = 20
+
+# Event pages list comments and attendees this many at a time.
+
+EVENT_PAGE_SIZE = 50
+
+# Search results are listed this many at a time, per kind.
+
+SEARCH_PAGE_SIZE = 20
+
+# Nearby events are looked for within NEARBY_RADIUS_KM unless ?radius= asks
+# for another distance, which is capped at NEARBY_MAX_RADIUS_KM.
+
+NEARBY_RADIUS_KM = 25
+NEARBY_MAX_RADIUS_KM = 100
+
+# The index page lists at most this many of them.
+
+NEARBY_EVENTS = 10
+
+# Calendar feeds list upcoming events and those of the last this many days.
+
+CALENDAR_PAST_DAYS = 30
+
+
+# API pagination
+# Collections are returned in pages of API_PAGE_SIZE rows unless ?limit= asks
+# for another size, which is capped at API_MAX_PAGE_SIZE.
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Lists added to each item with ?include= hold at most this many entries.
+
+API_INCLUDE_MAX_SIZE = 20
+
+# /api/batch/ resolves at most this many group and event slugs per request.
+
+API_BATCH_MAX_SIZE = 50
+
+# Full exports (?stream=1) are read from the database and written out in
+# chunks of this many rows.
+
+API_STREAM_CHUNK_SIZE = 2000
+
+
+# Public pages and API responses may be reused by browsers and proxies for
+# this many seconds; after that they are revalidated with ETags.
+
+PUBLIC_CACHE_MAX_AGE = 60
+
+# Pages rendered for anonymous visitors are cached until the data they show
+# changes, and for at most PAGE_CACHE_TIMEOUT seconds. Stale pages are still
+# served for up to PAGE_CACHE_STALE_TIMEOUT while one request renders them
+# again; it may take PAGE_CACHE_LOCK_TIMEOUT seconds before another does.
+# The lock only saves duplicate renders, see main.middleware.PageCacheMiddleware.
+# Visitors wait up to PAGE_CACHE_LOCK_WAIT for the first render of a page.
+
+PAGE_CACHE_TIMEOUT = 300
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_LOCK_WAIT = 2
+
 
 # The age of session cookies, in seconds
 # https://docs.djangoproject.com/en/2.0/topics/http/sessions/